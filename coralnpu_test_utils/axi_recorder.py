@@ -0,0 +1,305 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+import cocotb
+import numpy as np
+
+from cocotb.triggers import ClockCycles
+from cocotb.types import LogicArray
+
+
+class AxiPort:
+  MASTER = 0
+  SLAVE = 1
+
+
+class AxiChannel:
+  AR = 0
+  AW = 1
+  W = 2
+  R = 3
+  B = 4
+  # A write through the TCM backdoor of up to 16 bytes, with `len` holding
+  # the number of bytes minus one.
+  BACKDOOR = 5
+
+
+# One row per handshake. Data is 16 bytes in byte lane order.
+AXI_RECORD_DTYPE = np.dtype([
+    ("cycle", "<u8"),
+    ("port", "u1"),
+    ("channel", "u1"),
+    ("id", "u1"),
+    ("len", "u1"),
+    ("size", "u1"),
+    ("burst", "u1"),
+    ("resp", "u1"),
+    ("last", "u1"),
+    ("strb", "<u2"),
+    ("addr", "<u8"),
+    ("data", "u1", (16,)),
+])
+
+_NO_DATA = np.zeros([16], dtype=np.uint8)
+
+
+class AxiRecorder:
+  """Records AXI handshakes into a numpy structured array.
+
+  Rows are appended to fixed size chunks, so recording costs one structured
+  row assignment per handshake. The recording is saved as a .npy file, which
+  `load_recording` maps back into memory without reading it all.
+  """
+
+  def __init__(self, chunk_rows=65536):
+    self.chunk_rows = chunk_rows
+    self.chunks = []
+    self.chunk = np.zeros([chunk_rows], dtype=AXI_RECORD_DTYPE)
+    self.rows = 0
+
+  def __len__(self):
+    return len(self.chunks) * self.chunk_rows + self.rows
+
+  def record(self, cycle, port, channel, axi_id=0, addr=0, length=0, size=0,
+             burst=0, resp=0, last=0, strb=0, data=_NO_DATA):
+    if self.rows == self.chunk_rows:
+      self.chunks.append(self.chunk)
+      self.chunk = np.zeros([self.chunk_rows], dtype=AXI_RECORD_DTYPE)
+      self.rows = 0
+    self.chunk[self.rows] = (cycle, port, channel, axi_id, length, size, burst,
+                             resp, last, strb, addr, data)
+    self.rows += 1
+
+  def record_backdoor(self, cycle, addr, data):
+    """Records a TCM backdoor write, split into chunks of 16 bytes."""
+    for offset in range(0, len(data), 16):
+      chunk = data[offset:offset + 16]
+      self.record(cycle, AxiPort.SLAVE, AxiChannel.BACKDOOR,
+                  addr=addr + offset, length=len(chunk) - 1,
+                  data=np.pad(chunk, (0, 16 - len(chunk))))
+
+  def to_array(self):
+    return np.concatenate(self.chunks + [self.chunk[:self.rows]])
+
+  def save(self, path):
+    np.save(path, self.to_array())
+
+
+def lane_bytes(value):
+  """Returns a LogicArray bus value (or 0) as bytes in byte lane order."""
+  if isinstance(value, int):
+    return _NO_DATA
+  return np.frombuffer(value.resolve("zeros").to_bytes(byteorder="little"),
+                       dtype=np.uint8)
+
+
+def load_recording(path):
+  """Returns a recording saved by AxiRecorder.save, memory-mapped."""
+  return np.load(path, mmap_mode="r")
+
+
+def _bursts(rows):
+  """Splits data beat rows into a list of bursts ending at `last`."""
+  bursts = []
+  start = 0
+  for i in np.flatnonzero(rows["last"]):
+    bursts.append(rows[start:i + 1])
+    start = i + 1
+  return bursts
+
+
+class AxiReplay:
+  """Drives a recording back into a CoreMiniAxiInterface.
+
+  Slave port requests and TCM backdoor writes are issued at their recorded
+  cycles, relative to the earliest record, so each request's VALID rises at the
+  same relative cycle as in the recording. Their responses are compared with
+  the recording. The master port is answered from the recorded R and B
+  streams rather than the memory model, pairing the DUT's n-th read or write
+  with the n-th recorded one. No ELF or memory model is needed.
+
+  The interface must be initialized with `init(memory_agents=False)`, so the
+  replay owns the master port fifos. Differences from the recording are
+  collected as messages in `mismatches`.
+  """
+
+  def __init__(self, core_mini_axi, records):
+    self.core_mini_axi = core_mini_axi
+    self.records = records
+    self.mismatches = []
+    master = records[records["port"] == AxiPort.MASTER]
+    slave = records[records["port"] == AxiPort.SLAVE]
+
+    def channel(rows, ch):
+      return rows[rows["channel"] == ch]
+
+    self.master_reads = list(zip(channel(master, AxiChannel.AR),
+                                 _bursts(channel(master, AxiChannel.R))))
+    self.master_writes = list(zip(channel(master, AxiChannel.AW),
+                                  _bursts(channel(master, AxiChannel.W)),
+                                  channel(master, AxiChannel.B)))
+    stimulus = np.isin(records["channel"], [AxiChannel.AR, AxiChannel.AW,
+                                            AxiChannel.W])
+    self.stimulus = records[((records["port"] == AxiPort.SLAVE) & stimulus) |
+                            (records["channel"] == AxiChannel.BACKDOOR)]
+    # Rows are appended at the handshake but stamped with the VALID cycle,
+    # so put requests of different channels back into VALID order.
+    self.stimulus = self.stimulus[np.argsort(self.stimulus["cycle"],
+                                             kind="stable")]
+    self.slave_responses = collections.defaultdict(collections.deque)
+    for row in slave[np.isin(slave["channel"], [AxiChannel.R, AxiChannel.B])]:
+      self.slave_responses[(int(row["channel"]), int(row["id"]))].append(row)
+    self.slave_response_count = sum(
+        len(q) for q in self.slave_responses.values())
+
+  def _mismatch(self, what, got, expected):
+    self.mismatches.append(f"{what}: got {got}, expected {expected}")
+
+  async def _master_read_responder(self):
+    core = self.core_mini_axi
+    reads = iter(self.master_reads)
+    while True:
+      ardata = await core.master_arfifo.get()
+      recorded = next(reads, None)
+      if recorded is None:
+        self._mismatch("master AR", hex(ardata["addr"]), "no more reads")
+        beats = [None] * (ardata["len"] + 1)
+      else:
+        ar, beats = recorded
+        if ardata["addr"] != ar["addr"] or ardata["len"] != ar["len"]:
+          self._mismatch("master AR",
+                         (hex(ardata["addr"]), ardata["len"]),
+                         (hex(int(ar["addr"])), int(ar["len"])))
+      for i in range(ardata["len"] + 1):
+        rdata = dict()
+        rdata["id"] = ardata["id"]
+        rdata["last"] = 1 if (i == ardata["len"]) else 0
+        if i < len(beats) and beats[i] is not None:
+          rdata["data"] = LogicArray.from_bytes(beats[i]["data"].tobytes(),
+                                                byteorder="little")
+          rdata["resp"] = int(beats[i]["resp"])
+        else:
+          rdata["data"] = 0
+          rdata["resp"] = 2  # SLVERR
+        await core.master_rfifo.put(rdata)
+
+  async def _master_write_responder(self):
+    core = self.core_mini_axi
+    writes = iter(self.master_writes)
+    while True:
+      awdata = await core.master_awfifo.get()
+      beats = []
+      while True:
+        wdata = await core.master_wfifo.get()
+        beats.append(wdata)
+        if wdata["last"]:
+          break
+      recorded = next(writes, None)
+      bdata = dict()
+      bdata["id"] = awdata["id"]
+      if recorded is None:
+        self._mismatch("master AW", hex(awdata["addr"]), "no more writes")
+        bdata["resp"] = 2  # SLVERR
+      else:
+        aw, wbeats, b = recorded
+        if awdata["addr"] != aw["addr"] or len(beats) != len(wbeats):
+          self._mismatch("master AW",
+                         (hex(awdata["addr"]), len(beats)),
+                         (hex(int(aw["addr"])), len(wbeats)))
+        for got, expected in zip(beats, wbeats):
+          data = np.frombuffer(got["data"], dtype=np.uint8)[::-1]
+          if got["strb"] != expected["strb"] or \
+              (data != expected["data"]).any():
+            self._mismatch("master W data", data, expected["data"])
+        bdata["resp"] = int(b["resp"])
+      await core.master_bfifo.put(bdata)
+
+  def _check_slave_response(self, channel, axi_id, what, resp, data=None):
+    expected = self.slave_responses.get((channel, axi_id))
+    if not expected:
+      self._mismatch(what, f"response for ID {axi_id}", "none")
+      return
+    row = expected.popleft()
+    if resp != row["resp"]:
+      self._mismatch(f"{what} resp", resp, int(row["resp"]))
+    if data is not None and (data != row["data"]).any():
+      self._mismatch(f"{what} data", data, row["data"])
+
+  async def _slave_response_checker(self, channel):
+    """Checks the slave port's `channel` responses as the agent queues them.
+
+    The R and B agents only queue a response once its VALID is seen, so
+    this sleeps on the fifo rather than waking every cycle.
+    """
+    core = self.core_mini_axi
+    remaining = sum(len(q) for (ch, _), q in self.slave_responses.items()
+                    if ch == channel)
+    for _ in range(remaining):
+      if channel == AxiChannel.B:
+        bdata = await core.slave_bfifo.get()
+        self._check_slave_response(AxiChannel.B, bdata["id"], "slave B",
+                                   bdata["resp"])
+      else:
+        rdata = await core.slave_rfifo.get()
+        self._check_slave_response(AxiChannel.R, rdata["id"].to_unsigned(),
+                                   "slave R", rdata["resp"].to_unsigned(),
+                                   rdata["data"][::-1])
+
+  async def run(self):
+    """Replays the recording, returning once all slave responses arrived."""
+    core = self.core_mini_axi
+    cocotb.start_soon(self._master_read_responder())
+    cocotb.start_soon(self._master_write_responder())
+    checkers = [cocotb.start_soon(self._slave_response_checker(channel))
+                for channel in (AxiChannel.R, AxiChannel.B)]
+
+    if len(self.stimulus):
+      base = int(self.records["cycle"].min())
+      start = core._cycle() + 1
+      for row in self.stimulus:
+        channel = int(row["channel"])
+        # Requests are recorded at the cycle their VALID was raised. The
+        # agents raise VALID on the clock edge after an item is queued, so
+        # queue them one cycle early.
+        cycle = start + int(row["cycle"]) - base
+        if channel != AxiChannel.BACKDOOR:
+          cycle -= 1
+        delay = cycle - core._cycle()
+        if delay > 0:
+          await ClockCycles(core.dut.io_aclk, delay)
+        if channel == AxiChannel.BACKDOOR:
+          await core.write_backdoor(int(row["addr"]),
+                                    row["data"][:int(row["len"]) + 1].copy())
+        elif channel == AxiChannel.W:
+          wdata = dict()
+          wdata["data"] = LogicArray.from_bytes(row["data"].tobytes(),
+                                                byteorder="little")
+          wdata["strb"] = int(row["strb"])
+          wdata["last"] = bool(row["last"])
+          await core.slave_wfifo.put(wdata)
+        else:
+          adata = dict()
+          adata["addr"] = int(row["addr"])
+          adata["id"] = int(row["id"])
+          adata["len"] = int(row["len"])
+          adata["size"] = int(row["size"])
+          adata["burst"] = int(row["burst"])
+          fifo = core.slave_arfifo if channel == AxiChannel.AR \
+              else core.slave_awfifo
+          await fifo.put(adata)
+    for checker in checkers:
+      await checker
+    return self.mismatches
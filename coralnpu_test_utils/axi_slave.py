@@ -13,11 +13,32 @@
 # limitations under the License.
 
 import cocotb
+import numpy as np
 from cocotb.queue import Queue
-from cocotb.triggers import RisingEdge, FallingEdge
+from cocotb.triggers import ClockCycles, RisingEdge, FallingEdge
+
+from coralnpu_test_utils.axi_util import (AxiBurst, AxiResp,
+                                          axi_burst_addresses, get_masks)
+from coralnpu_test_utils.paged_memory import PagedMemory
+from coralnpu_test_utils.shared_memory import MappedMemory
 
 class AxiSlave:
-    def __init__(self, dut, name, clock, reset, log, has_memory=False, mem_base_addr=0):
+    """AXI responder for a DUT master port, optionally backed by memory.
+
+    Memory is a PagedMemory of `mem_size` bytes (1 GiB by default) at
+    `mem_base_addr`, reading 0xBD where it was never written. With
+    `mem_shm_name` or `mem_file` it is a MappedMemory instead, which other
+    processes can attach to. That needs an explicit `mem_size`, and a fresh
+    mapping reads zero so that untouched pages are never written. Multi-beat
+    FIXED/INCR/WRAP bursts are supported on the full data bus width.
+    Addresses are accepted every cycle, and responses are returned
+    `read_latency`/`write_latency` cycles after the address (and for writes,
+    the last data beat) arrived.
+    """
+
+    def __init__(self, dut, name, clock, reset, log, has_memory=False,
+                 mem_base_addr=0, mem_size=None, read_latency=0,
+                 write_latency=0, mem_shm_name=None, mem_file=None):
         self.dut = dut
         self.name = name
         self.clock = clock
@@ -25,9 +46,21 @@ class AxiSlave:
         self.log = log
         self.has_memory = has_memory
         self.mem_base_addr = mem_base_addr
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        data_bits = len(getattr(dut, f'io_{name}_read_data_bits_data'))
+        self.data_bytes = data_bits // 8
+        self.lanes = np.arange(self.data_bytes, dtype=np.int64)
+        self.cycle = 0
 
-        if self.has_memory:
-            self.memory = {}
+        if self.has_memory and (mem_shm_name or mem_file):
+            if mem_size is None:
+                raise ValueError(
+                    "mem_size is required with mem_shm_name or mem_file")
+            self.memory = MappedMemory(mem_size, base_addr=mem_base_addr,
+                                       name=mem_shm_name, path=mem_file)
+        elif self.has_memory:
+            self.memory = PagedMemory(mem_size or (1 << 30), fill=0xBD)
 
         self.ar_queue = Queue()
         self.aw_queue = Queue()
@@ -35,54 +68,101 @@ class AxiSlave:
         self.r_queue = Queue()
         self.b_queue = Queue()
 
-    def start(self):
-        cocotb.start_soon(self._aw_agent())
-        cocotb.start_soon(self._w_agent())
-        cocotb.start_soon(self._b_agent())
-        cocotb.start_soon(self._ar_agent())
-        cocotb.start_soon(self._r_agent())
+    def start(self, port_agents=True):
+        """Starts the responder.
+
+        Without `port_agents`, the DUT port is left alone and the caller feeds
+        the address and data queues and collects the responses itself.
+        """
+        cocotb.start_soon(self._cycle_counter())
+        if port_agents:
+            cocotb.start_soon(self._aw_agent())
+            cocotb.start_soon(self._w_agent())
+            cocotb.start_soon(self._b_agent())
+            cocotb.start_soon(self._ar_agent())
+            cocotb.start_soon(self._r_agent())
         cocotb.start_soon(self._write_handler())
         cocotb.start_soon(self._read_handler())
 
+    async def _cycle_counter(self):
+        while True:
+            await RisingEdge(self.clock)
+            self.cycle += 1
+
+    async def _wait_until(self, cycle):
+        if cycle > self.cycle:
+            await ClockCycles(self.clock, cycle - self.cycle)
+
+    def _beat_offsets(self, adata):
+        """Returns the [beats, data_bytes] memory offsets of a burst's lanes.
+
+        Returns None if any beat falls outside of the memory.
+        """
+        addrs = axi_burst_addresses(adata["addr"], adata["size"], adata["len"],
+                                    adata.get("burst", AxiBurst.INCR))
+        lines = (addrs & ~(self.data_bytes - 1)) - self.mem_base_addr
+        if lines.min() < 0 or lines.max() + self.data_bytes > len(self.memory):
+            return None
+        return lines[:, np.newaxis] + self.lanes
+
     async def _read_handler(self):
         while True:
             ardata = await self.ar_queue.get()
+            beats = ardata["len"] + 1
+            resp = AxiResp.OKAY
             if self.has_memory:
-                addr = ardata["addr"] - self.mem_base_addr
-                num_bytes = 2**ardata["size"]
-                read_bytes = bytearray()
-                for i in range(num_bytes):
-                    read_bytes.append(self.memory.get(addr + i, 0xBD))
-                read_data = int.from_bytes(read_bytes, byteorder='little')
+                offsets = self._beat_offsets(ardata)
+                if offsets is None:
+                    resp = AxiResp.SLVERR
+                    read_data = [0] * beats
+                else:
+                    lines = self.memory.gather(offsets)
+                    read_data = [
+                        int.from_bytes(line.tobytes(), byteorder='little')
+                        for line in lines
+                    ]
             else:
-                read_data = 0xDEADBEEF
-
-            # Create a dummy response
-            rdata = {
-                "id": ardata["id"],
-                "data": read_data,
-                "resp": 0,
-                "last": 1
-            }
-            await self.r_queue.put(rdata)
+                read_data = [0xDEADBEEF] * beats
+
+            await self._wait_until(ardata["cycle"] + self.read_latency)
+            for i in range(beats):
+                rdata = {
+                    "id": ardata["id"],
+                    "data": read_data[i],
+                    "resp": resp,
+                    "last": 1 if (i == beats - 1) else 0,
+                }
+                await self.r_queue.put(rdata)
 
     async def _write_handler(self):
         while True:
             awdata = await self.aw_queue.get()
-            wdata = await self.w_queue.get()
-            resp = 0
+            beats = []
+            while True:
+                wdata = await self.w_queue.get()
+                beats.append(wdata)
+                if wdata["last"] or len(beats) == awdata["len"] + 1:
+                    break
+            resp = AxiResp.OKAY
             if self.has_memory:
-                addr = awdata["addr"] - self.mem_base_addr
-                strb = int(wdata["strb"])
-                data = wdata["data"]
-                for i in range(len(data)):
-                    if (strb >> i) & 1:
-                        self.memory[addr + i] = data[len(data)-1-i]
+                offsets = self._beat_offsets(awdata)
+                if offsets is None:
+                    resp = AxiResp.SLVERR
+                else:
+                    # Beats are captured MSB first, flip them into lane order.
+                    data = np.frombuffer(b"".join(w["data"] for w in beats),
+                                         dtype=np.uint8)
+                    data = data.reshape(len(beats), self.data_bytes)[:, ::-1]
+                    masks = get_masks([int(w["strb"]) for w in beats],
+                                      self.data_bytes)
+                    self.memory.scatter(offsets[:len(beats)][masks],
+                                        data[masks])
             else:
-                resp = 3 # DECERR
+                resp = AxiResp.DECERR
                 self.log.error(f"Write received on slave {self.name}, which does not have memory.")
 
-            # Create a response
+            await self._wait_until(
+                max(awdata["cycle"], beats[-1]["cycle"]) + self.write_latency)
             bdata = {
                 "id": awdata["id"],
                 "resp": resp,
@@ -98,6 +178,7 @@ class AxiSlave:
               ardata = dict()
               for prop in ["id", "addr", "size", "len", "burst"]:
                   ardata[prop] = int(getattr(self.dut, f'io_{self.name}_read_addr_bits_{prop}').value)
+              ardata["cycle"] = self.cycle
               await self.ar_queue.put(ardata)
           except Exception as e:
             print('X seen in _ar_agent: ' + str(e), flush=True)
@@ -128,8 +209,9 @@ class AxiSlave:
           try:
             if getattr(self.dut, f'io_{self.name}_write_addr_valid').value:
               awdata = dict()
-              for prop in ["id", "addr", "size", "len"]:
+              for prop in ["id", "addr", "size", "len", "burst"]:
                   awdata[prop] = int(getattr(self.dut, f'io_{self.name}_write_addr_bits_{prop}').value)
+              awdata["cycle"] = self.cycle
               await self.aw_queue.put(awdata)
           except Exception as e:
             print('X seen in _aw_agent: ' + str(e), flush=True)
@@ -144,11 +226,12 @@ class AxiSlave:
               wdata["data"] = getattr(self.dut, f'io_{self.name}_write_data_bits_data').value.buff
               for prop in ["strb", "last"]:
                   wdata[prop] = getattr(self.dut, f'io_{self.name}_write_data_bits_{prop}').value
+              wdata["cycle"] = self.cycle
               await self.w_queue.put(wdata)
           except Exception as e:
             print('X seen in _w_agent: ' + str(e), flush=True)
 
-    async def _b_agent(self):
+    async def _b_agent(self, timeout=4096):
         while True:
           while True:
             await RisingEdge(self.clock)
@@ -162,7 +245,7 @@ class AxiSlave:
           await FallingEdge(self.clock)
           timeout_count = 0
           while getattr(self.dut, f'io_{self.name}_write_resp_ready').value == 0:
-            await FallingEdge(clock)
+            await FallingEdge(self.clock)
             timeout_count += 1
             if timeout_count >= timeout:
               assert False, "timeout waiting for bready"
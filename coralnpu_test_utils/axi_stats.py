@@ -0,0 +1,172 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import json
+
+
+AXI_CHANNELS = ("ar", "aw", "w", "r", "b")
+
+
+def _summarize(histogram):
+  """Returns count/min/max/mean/p50/p99 of a {value: count} histogram."""
+  total = sum(histogram.values())
+  if total == 0:
+    return {"count": 0}
+  values = sorted(histogram)
+  summary = {
+      "count": total,
+      "min": values[0],
+      "max": values[-1],
+      "mean": sum(v * n for v, n in histogram.items()) / total,
+  }
+  for name, fraction in (("p50", 0.5), ("p99", 0.99)):
+    seen = 0
+    for v in values:
+      seen += histogram[v]
+      if seen >= fraction * total:
+        summary[name] = v
+        break
+  return summary
+
+
+class AxiPortStats:
+  """Handshake timing statistics for one AXI port.
+
+  Handshakes are reported with the clock cycle they happened in. Read
+  latencies are measured from the AR handshake to the first and last R beat,
+  write latencies from the AW handshake to the first W beat and to B, and
+  kept as per-ID histograms of cycles.
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.handshakes = {channel: 0 for channel in AXI_CHANNELS}
+    # Cycles spent with valid high waiting for ready, per channel.
+    self.stall_cycles = {channel: 0 for channel in AXI_CHANNELS}
+    self.read_bytes = 0
+    self.write_bytes = 0
+    self.first_cycle = None
+    self.last_cycle = None
+    # AXI ID -> deque of [AR cycle, bytes per beat, first beat seen].
+    self.pending_reads = collections.defaultdict(collections.deque)
+    # AXI ID -> deque of AW cycles; AW cycles not yet matched with W data.
+    self.pending_writes = collections.defaultdict(collections.deque)
+    self.pending_wdata = collections.deque()
+    self.in_wburst = False
+    self.latency = collections.defaultdict(
+        lambda: collections.defaultdict(collections.Counter))
+
+  def _handshake(self, channel, cycle, stall):
+    self.handshakes[channel] += 1
+    self.stall_cycles[channel] += stall
+    if self.first_cycle is None:
+      self.first_cycle = cycle
+    self.last_cycle = cycle
+
+  def _latency(self, kind, axi_id, cycles):
+    self.latency[kind][axi_id][cycles] += 1
+
+  def ar(self, cycle, axi_id, size, stall=0):
+    self._handshake("ar", cycle, stall)
+    self.pending_reads[axi_id].append([cycle, 1 << size, False])
+
+  def r(self, cycle, axi_id, last, stall=0):
+    self._handshake("r", cycle, stall)
+    pending = self.pending_reads.get(axi_id)
+    if not pending:
+      return
+    state = pending[0]
+    self.read_bytes += state[1]
+    if not state[2]:
+      state[2] = True
+      self._latency("ar_to_first_r", axi_id, cycle - state[0])
+    if last:
+      pending.popleft()
+      self._latency("ar_to_last_r", axi_id, cycle - state[0])
+
+  def aw(self, cycle, axi_id, stall=0):
+    self._handshake("aw", cycle, stall)
+    self.pending_writes[axi_id].append(cycle)
+    self.pending_wdata.append((axi_id, cycle))
+
+  def w(self, cycle, nbytes, last, stall=0):
+    self._handshake("w", cycle, stall)
+    self.write_bytes += nbytes
+    first = not self.in_wburst
+    self.in_wburst = not last
+    if first and self.pending_wdata:
+      axi_id, aw_cycle = self.pending_wdata.popleft()
+      self._latency("aw_to_first_w", axi_id, cycle - aw_cycle)
+
+  def b(self, cycle, axi_id, stall=0):
+    self._handshake("b", cycle, stall)
+    pending = self.pending_writes.get(axi_id)
+    if pending:
+      self._latency("aw_to_b", axi_id, cycle - pending.popleft())
+
+  def to_dict(self):
+    cycles = 0
+    if self.first_cycle is not None:
+      cycles = self.last_cycle - self.first_cycle + 1
+    latency = {}
+    for kind, per_id in self.latency.items():
+      merged = collections.Counter()
+      for histogram in per_id.values():
+        merged.update(histogram)
+      latency[kind] = {
+          "summary": _summarize(merged),
+          "per_id": {
+              str(axi_id): {str(k): v for k, v in sorted(histogram.items())}
+              for axi_id, histogram in sorted(per_id.items())
+          },
+      }
+    return {
+        "handshakes": dict(self.handshakes),
+        "stall_cycles": dict(self.stall_cycles),
+        "active_cycles": cycles,
+        "read_bytes": self.read_bytes,
+        "write_bytes": self.write_bytes,
+        "read_bytes_per_cycle": self.read_bytes / cycles if cycles else 0,
+        "write_bytes_per_cycle": self.write_bytes / cycles if cycles else 0,
+        "latency": latency,
+    }
+
+
+class AxiStats:
+  """AXI statistics for the ports of a DUT, plus fifo high-water marks."""
+
+  def __init__(self, ports=("master", "slave")):
+    self.ports = {name: AxiPortStats(name) for name in ports}
+    self.fifo_high_water = collections.Counter()
+
+  def __getitem__(self, port):
+    return self.ports[port]
+
+  def fifo_depth(self, name, depth):
+    if depth > self.fifo_high_water[name]:
+      self.fifo_high_water[name] = depth
+
+  def to_dict(self):
+    return {
+        "ports": {name: port.to_dict() for name, port in self.ports.items()},
+        "fifo_high_water": dict(self.fifo_high_water),
+    }
+
+  def to_json(self, **kwargs):
+    return json.dumps(self.to_dict(), **kwargs)
+
+  def dump(self, path):
+    with open(path, "w") as f:
+      json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,59 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class AxiResp:
+  OKAY = 0
+  EXOKAY = 1
+  SLVERR = 2
+  DECERR = 3
+
+
+class AxiBurst:
+  FIXED = 0
+  INCR = 1
+  WRAP = 2
+
+
+def get_masks(strbs, width=16):
+  """Expands a sequence of strobe values into a [beats, width] bool array."""
+  strbs = np.asarray(strbs, dtype=np.uint32).reshape(-1, 1)
+  masks = np.unpackbits(strbs.view(np.uint8), axis=1, bitorder="little")
+  return masks[:, :width].astype(bool)
+
+
+def axi_burst_addresses(addr, size, length, burst):
+  """Returns the address of every beat of an AXI burst as a numpy array.
+
+  Args:
+    addr: The start address of the burst (AxADDR).
+    size: The log2 of the number of bytes per beat (AxSIZE).
+    length: The number of beats minus one (AxLEN).
+    burst: The AxiBurst type.
+  """
+  beats = np.arange(length + 1, dtype=np.int64)
+  if burst == AxiBurst.FIXED:
+    return np.full(length + 1, addr, dtype=np.int64)
+  beat_bytes = 1 << size
+  aligned_addr = (addr // beat_bytes) * beat_bytes
+  if burst == AxiBurst.WRAP:
+    wrap_bytes = beat_bytes * (length + 1)
+    lower = (addr // wrap_bytes) * wrap_bytes
+    addrs = lower + ((aligned_addr - lower) + beats * beat_bytes) % wrap_bytes
+  else:
+    addrs = aligned_addr + beats * beat_bytes
+  addrs[0] = addr
+  return addrs
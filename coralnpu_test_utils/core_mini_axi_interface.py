@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import cocotb
+import contextlib
 import itertools
 import math
 import numpy as np
@@ -20,22 +21,18 @@ import random
 
 
 from cocotb.clock import Clock
+from cocotb.handle import Immediate
 from cocotb.queue import Queue
-from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge
-from elftools.elf.elffile import ELFFile
+from cocotb.triggers import Timer, ClockCycles, RisingEdge, FallingEdge, ReadOnly, First, Event, ValueChange
+from cocotb.utils import get_sim_time
 
-
-class AxiResp:
-  OKAY = 0
-  EXOKAY = 1
-  SLVERR = 2
-  DECERR = 3
-
-
-class AxiBurst:
-  FIXED = 0
-  INCR = 1
-  WRAP = 2
+from coralnpu_test_utils.axi_recorder import AxiChannel, AxiPort, lane_bytes
+from coralnpu_test_utils.axi_stats import AxiStats
+from coralnpu_test_utils.axi_util import AxiBurst, AxiResp, axi_burst_addresses, get_masks
+from coralnpu_test_utils.elf_image import load_elf_image
+from coralnpu_test_utils.memory_timing import MemoryTimingModel
+from coralnpu_test_utils.paged_memory import PagedMemory
+from coralnpu_test_utils.shared_memory import MappedMemory
 
 
 class DmReqOp:
@@ -84,6 +81,9 @@ def format_line_from_word(word, addr):
   line = np.roll(line.view(np.uint8), shift)
   return convert_to_binary_value(line)
 
+def pad_to_multiple_len(length, multiple):
+  return ((length + multiple - 1) // multiple) * multiple
+
 def pad_to_multiple(x, multiple):
   padding = multiple - (len(x) % multiple)
   if padding == multiple:
@@ -101,6 +101,113 @@ def get_strb(mask):
 def convert_to_binary_value(data):
   return cocotb.types.LogicArray.from_bytes(data, byteorder="little")
 
+def decode_logic_array(value):
+  """Decodes a LogicArray into uint8 data and X/Z mask arrays.
+
+  Both arrays hold the most significant byte first. Bits which are not 0 or 1
+  read as zero in the data and are set in the mask.
+  """
+  if value.is_resolvable:
+    data = np.frombuffer(value.to_bytes(byteorder="big"), dtype=np.uint8)
+    return data, np.zeros_like(data)
+  bits = np.frombuffer(str(value).encode("ascii"), dtype=np.uint8)
+  data = np.packbits(bits == ord("1"))
+  xmask = np.packbits((bits != ord("0")) & (bits != ord("1")))
+  return data, xmask
+
+# (instance name, base address, size) of each TCM, see MemoryRegions in
+# hdl/chisel/src/coralnpu/Parameters.scala.
+TCM_REGIONS = [
+    ("itcm", 0x00000, 0x2000),
+    ("dtcm", 0x10000, 0x8000),
+]
+TCM_REGIONS_HIGHMEM = [
+    ("itcm", 0x000000, 0x100000),
+    ("dtcm", 0x100000, 0x100000),
+]
+
+
+class TcmBackdoor:
+  """Direct access to the SRAM arrays of a TCM through simulator handles.
+
+  Each TCM is built from one or more 128-bit wide SRAM macros
+  (`<tcm>.sram.sramModules_<n>.mem`) which split the TCM into equally sized,
+  consecutive ranges. Only the SRAM words covering an access are touched,
+  since reading or assigning a whole macro costs one simulator call per word.
+  """
+
+  def __init__(self, base_addr, size, mems):
+    self.base_addr = base_addr
+    self.size = size
+    self.mems = mems
+    self.lines_per_mem = (size // 16) // len(mems)
+
+  @classmethod
+  def find(cls, dut, name, base_addr, size):
+    """Returns a TcmBackdoor for TCM `name`, or None if it isn't visible."""
+    mems = []
+    try:
+      sram = getattr(dut, name).sram
+      while True:
+        mems.append(getattr(sram, f"sramModules_{len(mems)}").mem)
+    except AttributeError:
+      pass
+    if not mems or len(mems[0]) * len(mems) * 16 != size:
+      return None
+    return cls(base_addr, size, mems)
+
+  def contains(self, addr, size):
+    return (addr >= self.base_addr) and \
+        (addr + size <= self.base_addr + self.size)
+
+  def _mem_ranges(self, addr, size):
+    """Yields (mem, first line, last line) covering [addr, addr + size)."""
+    first_line = (addr - self.base_addr) // 16
+    last_line = (addr - self.base_addr + size - 1) // 16
+    for i, mem in enumerate(self.mems):
+      mem_first = i * self.lines_per_mem
+      mem_last = mem_first + self.lines_per_mem - 1
+      lo = max(first_line, mem_first)
+      hi = min(last_line, mem_last)
+      if lo <= hi:
+        yield mem, lo - mem_first, hi - mem_first
+
+  def line_handle(self, addr):
+    """Returns the simulator handle of the SRAM word holding `addr`."""
+    line = (addr - self.base_addr) // 16
+    return self.mems[line // self.lines_per_mem][line % self.lines_per_mem]
+
+  def read(self, addr, size):
+    """Returns `size` bytes starting at `addr`, with X/Z read as zero."""
+    lines = []
+    for mem, lo, hi in self._mem_ranges(addr, size):
+      for j in range(lo, hi + 1):
+        lines.append(
+            mem[j].value.resolve("zeros").to_bytes(byteorder="little"))
+    offset = (addr - self.base_addr) % 16
+    data = np.frombuffer(b"".join(lines), dtype=np.uint8)
+    return data[offset:offset + size].copy()
+
+  def write(self, addr, data):
+    """Writes `data` to `addr`, assigning each SRAM word it covers once."""
+    data = data.view(np.uint8)
+    line_offset = (addr - self.base_addr) % 16
+    start = addr - line_offset
+    image = np.zeros([pad_to_multiple_len(line_offset + len(data), 16)],
+                     dtype=np.uint8)
+    # Preserve the bytes around the written range in partial lines.
+    if line_offset:
+      image[:16] = self.read(start, 16)
+    if (line_offset + len(data)) % 16:
+      image[-16:] = self.read(start + len(image) - 16, 16)
+    image[line_offset:line_offset + len(data)] = data
+    image = image.reshape(-1, 16)
+    row = 0
+    for mem, lo, hi in self._mem_ranges(addr, len(data)):
+      for j in range(lo, hi + 1):
+        mem[j].set(Immediate(convert_to_binary_value(image[row])))
+        row += 1
+
 
 class CoreMiniAxiInterface:
   def __init__(self,
@@ -109,6 +216,17 @@ class CoreMiniAxiInterface:
                csr_base_addr=0x30000,
                base_addr = 0x20000000,
                ext_mem_size=(4 * 1024 * 1024),
+               ext_mem_page_size=4096,
+               ext_mem_fill=0,
+               ext_mem_shm_name=None,
+               ext_mem_file=None,
+               tcm_regions=TCM_REGIONS,
+               backdoor_load=False,
+               max_outstanding=1,
+               axi_stats=False,
+               recorder=None,
+               memory_timing=None,
+               write_combining=False,
                **kwargs):
     self.dut = dut
     self.dut.io_aclk.value = 0
@@ -124,9 +242,45 @@ class CoreMiniAxiInterface:
     self.dut.io_axi_master_read_data_valid.value = 0
     self.dut.io_axi_master_write_resp_valid.value = 0
     self.clock = Clock(dut.io_aclk, clock_ns, unit="ns")
+    self.clock_period_ps = round(clock_ns * 1000)
     self.csr_base_addr = csr_base_addr
     self.memory_base_addr = base_addr
-    self.memory = np.zeros([ext_mem_size], dtype=np.uint8)
+    if ext_mem_shm_name or ext_mem_file:
+      # Shared with other processes, see shared_memory.attach_memory.
+      self.memory = MappedMemory(ext_mem_size,
+                                 base_addr=base_addr,
+                                 name=ext_mem_shm_name,
+                                 path=ext_mem_file,
+                                 fill=ext_mem_fill)
+    else:
+      # External memory is sparse, so ext_mem_size can cover a full DDR range.
+      self.memory = PagedMemory(ext_mem_size,
+                                page_size=ext_mem_page_size,
+                                fill=ext_mem_fill)
+    self.loaded_segments = []
+    # (start offset, end offset, Event) set when the core writes that range.
+    self.memory_watches = []
+    self.tcm_regions = tcm_regions
+    self.tcm_backdoors = None
+    self.backdoor_load = backdoor_load
+    # Default number of slave port transactions kept in flight by write/read.
+    self.max_outstanding = max_outstanding
+    # Per-port handshake statistics, only collected if `axi_stats` is set.
+    self.stats = AxiStats() if axi_stats else None
+    # If set, an AxiRecorder that logs every handshake on both ports.
+    self.recorder = recorder
+    # If a MemoryTiming is given, the master port is answered with its
+    # latencies instead of immediately.
+    self.memory_timing = None
+    if memory_timing is not None:
+      self.memory_timing = MemoryTimingModel(memory_timing)
+    # (address, data) buffered by write_buffered until the next flush.
+    self.write_combining = write_combining
+    self.pending_writes = []
+    # Slave port transactions whose address was accepted but whose last
+    # response wasn't received yet, see fast_forward.
+    self.slave_reads_in_flight = 0
+    self.slave_writes_in_flight = 0
     self.master_arfifo = Queue()
     self.master_awfifo = Queue()
     self.master_rfifo = Queue()
@@ -138,19 +292,69 @@ class CoreMiniAxiInterface:
     self.slave_wfifo = Queue()
     self.slave_bfifo = Queue()
 
-  async def init(self):
+  async def init(self, memory_agents=True):
+    """Starts the port agents.
+
+    Without `memory_agents`, nothing answers the master port and its fifos
+    are left to the caller, e.g. an AxiReplay.
+    """
     cocotb.start_soon(self.master_awagent())
     cocotb.start_soon(self.master_wagent())
     cocotb.start_soon(self.master_bagent())
     cocotb.start_soon(self.master_aragent())
     cocotb.start_soon(self.master_ragent())
-    cocotb.start_soon(self.slave_awagent())
-    cocotb.start_soon(self.slave_wagent())
-    cocotb.start_soon(self.slave_bagent())
-    cocotb.start_soon(self.slave_aragent())
-    cocotb.start_soon(self.slave_ragent())
-    cocotb.start_soon(self.memory_write_agent())
-    cocotb.start_soon(self.memory_read_agent())
+    self._start_slave_agents()
+    if memory_agents:
+      cocotb.start_soon(self.memory_write_agent())
+      cocotb.start_soon(self.memory_read_agent())
+
+  def _start_slave_agents(self):
+    self.slave_agents = [
+        cocotb.start_soon(self.slave_awagent()),
+        cocotb.start_soon(self.slave_wagent()),
+        cocotb.start_soon(self.slave_bagent()),
+        cocotb.start_soon(self.slave_aragent()),
+        cocotb.start_soon(self.slave_ragent()),
+    ]
+
+  def _slave_port_idle(self):
+    return (self.slave_arfifo.empty() and self.slave_awfifo.empty() and
+            self.slave_wfifo.empty() and
+            self.dut.io_axi_slave_read_addr_valid.value == 0 and
+            self.dut.io_axi_slave_write_addr_valid.value == 0 and
+            self.dut.io_axi_slave_write_data_valid.value == 0 and
+            self.slave_reads_in_flight == 0 and
+            self.slave_writes_in_flight == 0)
+
+  async def _drain_slave_port(self, timeout_cycles=4096):
+    """Waits until no slave port request or response is outstanding.
+
+    Checked on the falling edge, once the agents dropped valid after their
+    last handshake. Responses already received stay in the slave fifos.
+    """
+    for _ in range(timeout_cycles):
+      if self._slave_port_idle():
+        return
+      await FallingEdge(self.dut.io_aclk)
+    assert False, "timeout waiting for the slave port to drain"
+
+  @contextlib.asynccontextmanager
+  async def fast_forward(self, timeout_cycles=4096):
+    """Parks the slave port agents while the core runs on its own.
+
+    Outstanding slave port transactions are completed first. Inside the block
+    only the master port monitors, which wake when a valid rises, and whatever
+    the caller awaits (e.g. `wait_for_status`) are left with triggers in the
+    simulator. The slave port must not be used until the block exits and the
+    agents are restarted.
+    """
+    await self._drain_slave_port(timeout_cycles)
+    for task in self.slave_agents:
+      task.cancel()
+    try:
+      yield
+    finally:
+      self._start_slave_agents()
 
   async def read_csr(self, addr):
     val = await self.read_word(self.csr_base_addr + addr)
@@ -159,6 +363,45 @@ class CoreMiniAxiInterface:
   async def write_csr(self, addr, data):
     await self.write_word(self.csr_base_addr + addr, data)
 
+  def _cycle(self):
+    return get_sim_time(unit="ps") // self.clock_period_ps
+
+  async def _wait_until(self, cycle):
+    delay = cycle - self._cycle()
+    if delay > 0:
+      await ClockCycles(self.dut.io_aclk, delay)
+
+  def _record_depth(self, name, fifo, pending=0):
+    """Records the depth of `fifo`, plus `pending` items just taken from it."""
+    self.stats.fifo_depth(name, fifo.qsize() + pending)
+
+  async def _next_item(self, fifo):
+    """Returns the next item of `fifo`, aligned to a rising clock edge.
+
+    While `fifo` is empty the caller sleeps on the queue rather than waking
+    every cycle, and resumes on the first clock edge after an item arrives.
+    """
+    if fifo.empty():
+      item = await fifo.get()
+      await RisingEdge(self.dut.io_aclk)
+      return item
+    return fifo.get_nowait()
+
+  async def _wait_valid(self, valid):
+    """Waits for a rising clock edge at which `valid` is high.
+
+    While `valid` is low the caller sleeps until it rises instead of waking
+    every cycle. The settled value is checked in the ReadOnly phase so a
+    rising edge in the current time step is not missed.
+    """
+    while True:
+      await RisingEdge(self.dut.io_aclk)
+      if valid.value == 1:
+        return
+      await ReadOnly()
+      if valid.value != 1:
+        await RisingEdge(valid)
+
   async def slave_awagent(self, timeout=4096):
     self.dut.io_axi_slave_write_addr_valid.value = 0
     self.dut.io_axi_slave_write_addr_bits_prot.value   = 2
@@ -167,13 +410,11 @@ class CoreMiniAxiInterface:
     self.dut.io_axi_slave_write_addr_bits_qos.value    = 0
     self.dut.io_axi_slave_write_addr_bits_region.value = 0
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        self.dut.io_axi_slave_write_addr_valid.value = 0
-        if self.slave_awfifo.qsize():
-          break
-      awdata = await self.slave_awfifo.get()
+      await RisingEdge(self.dut.io_aclk)
+      self.dut.io_axi_slave_write_addr_valid.value = 0
+      awdata = await self._next_item(self.slave_awfifo)
       self.dut.io_axi_slave_write_addr_valid.value = 1
+      valid_cycle = self._cycle()
       self.dut.io_axi_slave_write_addr_bits_addr.value = awdata["addr"]
       self.dut.io_axi_slave_write_addr_bits_id.value = awdata["id"]
       self.dut.io_axi_slave_write_addr_bits_len.value = awdata["len"]
@@ -186,17 +427,23 @@ class CoreMiniAxiInterface:
         timeout_count += 1
         if timeout_count >= timeout:
           assert False, "timeout waiting for awready"
+      self.slave_writes_in_flight += 1
+      if self.stats:
+        self.stats["slave"].aw(self._cycle(), awdata["id"], timeout_count)
+        self._record_depth("slave_aw", self.slave_awfifo, 1)
+      if self.recorder:
+        self.recorder.record(valid_cycle, AxiPort.SLAVE, AxiChannel.AW,
+                             awdata["id"], awdata["addr"], awdata["len"],
+                             awdata["size"], awdata["burst"])
 
   async def slave_wagent(self, timeout=4096):
     self.dut.io_axi_slave_write_data_valid.value = 0
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        self.dut.io_axi_slave_write_data_valid.value = 0
-        if self.slave_wfifo.qsize():
-          break
-      wdata = await self.slave_wfifo.get()
+      await RisingEdge(self.dut.io_aclk)
+      self.dut.io_axi_slave_write_data_valid.value = 0
+      wdata = await self._next_item(self.slave_wfifo)
       self.dut.io_axi_slave_write_data_valid.value = 1
+      valid_cycle = self._cycle()
       self.dut.io_axi_slave_write_data_bits_data.value = wdata["data"]
       self.dut.io_axi_slave_write_data_bits_strb.value = wdata["strb"]
       self.dut.io_axi_slave_write_data_bits_last.value = wdata["last"]
@@ -207,17 +454,31 @@ class CoreMiniAxiInterface:
         timeout_count += 1
         if timeout_count >= timeout:
           assert False, "timeout waiting for wready"
+      if self.stats:
+        self.stats["slave"].w(self._cycle(), bin(wdata["strb"]).count("1"),
+                              wdata["last"], timeout_count)
+        self._record_depth("slave_w", self.slave_wfifo, 1)
+      if self.recorder:
+        self.recorder.record(valid_cycle, AxiPort.SLAVE, AxiChannel.W,
+                             last=wdata["last"], strb=wdata["strb"],
+                             data=lane_bytes(wdata["data"]))
 
   async def slave_bagent(self):
     self.dut.io_axi_slave_write_resp_ready.value = 1
     while True:
-      await RisingEdge(self.dut.io_aclk)
+      await self._wait_valid(self.dut.io_axi_slave_write_resp_valid)
       try:
-        if self.dut.io_axi_slave_write_resp_valid.value:
-          bdata = dict()
-          bdata["id"] = self.dut.io_axi_slave_write_resp_bits_id
-          bdata["resp"] = self.dut.io_axi_slave_write_resp_bits_resp
-          await self.slave_bfifo.put(bdata)
+        bdata = dict()
+        bdata["id"] = self.dut.io_axi_slave_write_resp_bits_id.value.to_unsigned()
+        bdata["resp"] = self.dut.io_axi_slave_write_resp_bits_resp.value.to_unsigned()
+        await self.slave_bfifo.put(bdata)
+        self.slave_writes_in_flight -= 1
+        if self.stats:
+          self.stats["slave"].b(self._cycle(), bdata["id"])
+          self._record_depth("slave_b", self.slave_bfifo)
+        if self.recorder:
+          self.recorder.record(self._cycle(), AxiPort.SLAVE, AxiChannel.B,
+                               bdata["id"], resp=bdata["resp"])
       except Exception as e:
         print('X seen in slave_bagent: ' + str(e))
 
@@ -229,13 +490,11 @@ class CoreMiniAxiInterface:
     self.dut.io_axi_slave_read_addr_bits_qos.value    = 0
     self.dut.io_axi_slave_read_addr_bits_region.value = 0
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        self.dut.io_axi_slave_read_addr_valid.value = 0
-        if self.slave_arfifo.qsize():
-          break
-      ardata = await self.slave_arfifo.get()
+      await RisingEdge(self.dut.io_aclk)
+      self.dut.io_axi_slave_read_addr_valid.value = 0
+      ardata = await self._next_item(self.slave_arfifo)
       self.dut.io_axi_slave_read_addr_valid.value = 1
+      valid_cycle = self._cycle()
       self.dut.io_axi_slave_read_addr_bits_addr.value = ardata["addr"]
       self.dut.io_axi_slave_read_addr_bits_id.value = ardata["id"]
       self.dut.io_axi_slave_read_addr_bits_len.value = ardata["len"]
@@ -248,76 +507,99 @@ class CoreMiniAxiInterface:
         timeout_count += 1
         if timeout_count >= timeout:
           assert False, "timeout waiting for arready"
+      self.slave_reads_in_flight += 1
+      if self.stats:
+        self.stats["slave"].ar(self._cycle(), ardata["id"], ardata["size"],
+                               timeout_count)
+        self._record_depth("slave_ar", self.slave_arfifo, 1)
+      if self.recorder:
+        self.recorder.record(valid_cycle, AxiPort.SLAVE, AxiChannel.AR,
+                             ardata["id"], ardata["addr"], ardata["len"],
+                             ardata["size"], ardata["burst"])
 
   async def slave_ragent(self):
     self.dut.io_axi_slave_read_data_ready.value = 1
     while True:
-      await RisingEdge(self.dut.io_aclk)
+      await self._wait_valid(self.dut.io_axi_slave_read_data_valid)
       try:
-        if self.dut.io_axi_slave_read_data_valid.value:
-          rdata = dict()
-          # Parse binary string value, replacing "X" with zero
-          # TODO(derekjchow): Consider passing in a x mask for checking downstream
-          nonx_data = str(self.dut.io_axi_slave_read_data_bits_data.value).replace("X", "0")
-          nonx_data = [ int(nonx_data[i:i+8], 2) for i in range(0, len(nonx_data), 8)]
-          nonx_data = np.array(nonx_data, dtype=np.uint8)
-          rdata["data"] = nonx_data
-          rdata["id"] = self.dut.io_axi_slave_read_data_bits_id.value
-          rdata["last"] = self.dut.io_axi_slave_read_data_bits_last.value
-          rdata["resp"] = self.dut.io_axi_slave_read_data_bits_resp.value
-          await self.slave_rfifo.put(rdata)
+        rdata = dict()
+        # X/Z bits read as zero, and are flagged in "xmask".
+        rdata["data"], rdata["xmask"] = decode_logic_array(
+            self.dut.io_axi_slave_read_data_bits_data.value)
+        rdata["id"] = self.dut.io_axi_slave_read_data_bits_id.value
+        rdata["last"] = self.dut.io_axi_slave_read_data_bits_last.value
+        rdata["resp"] = self.dut.io_axi_slave_read_data_bits_resp.value
+        await self.slave_rfifo.put(rdata)
+        if rdata["last"] == 1:
+          self.slave_reads_in_flight -= 1
+        if self.stats:
+          self.stats["slave"].r(self._cycle(), rdata["id"].to_unsigned(),
+                                rdata["last"] == 1)
+          self._record_depth("slave_r", self.slave_rfifo)
+        if self.recorder:
+          self.recorder.record(self._cycle(), AxiPort.SLAVE, AxiChannel.R,
+                               rdata["id"].to_unsigned(),
+                               resp=rdata["resp"].to_unsigned(),
+                               last=rdata["last"].to_unsigned(),
+                               data=rdata["data"][::-1])
       except Exception as e:
         print('X seen in slave_ragent: ' + str(e))
 
   async def memory_read_agent(self):
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        if self.master_arfifo.qsize():
-          break
       ardata = await self.master_arfifo.get()
-      data = self.read_memory(ardata)
-      if data is None:
-        for i in range(0, ardata["len"] + 1):
-          rdata = dict()
-          rdata["id"] = ardata["id"]
+      lines = self.read_memory(ardata)
+      beats = []
+      for i in range(0, ardata["len"] + 1):
+        rdata = dict()
+        rdata["id"] = ardata["id"]
+        if lines is None:
           rdata["data"] = 0
           rdata["resp"] = AxiResp.SLVERR
-          rdata["last"] = 1 if (i == ardata["len"]) else 0
-          await self.master_rfifo.put(rdata)
-      else:
-        for i in range(0, ardata["len"] + 1):
-          rdata = dict()
-          rdata["id"] = ardata["id"]
-          rdata["data"] = convert_to_binary_value(data)
+        else:
+          rdata["data"] = convert_to_binary_value(lines[i])
           rdata["resp"] = AxiResp.OKAY
-          rdata["last"] = 1 if (i == ardata["len"]) else 0
-          await self.master_rfifo.put(rdata)
+        rdata["last"] = 1 if (i == ardata["len"]) else 0
+        beats.append(rdata)
+      if self.memory_timing:
+        await self._wait_until(self.memory_timing.read(
+            ardata["cycle"], ardata["addr"], len(beats)))
+      beat_cycles = self.memory_timing.timing.beat_cycles \
+          if self.memory_timing else 1
+      for i, rdata in enumerate(beats):
+        if i and beat_cycles > 1:
+          await ClockCycles(self.dut.io_aclk, beat_cycles)
+        await self.master_rfifo.put(rdata)
 
   async def master_aragent(self):
     self.dut.io_axi_master_read_addr_ready.value = 1
     while True:
-      await RisingEdge(self.dut.io_aclk)
+      await self._wait_valid(self.dut.io_axi_master_read_addr_valid)
       try:
-        if self.dut.io_axi_master_read_addr_valid.value:
-          ardata = dict()
-          ardata["id"] = self.dut.io_axi_master_read_addr_bits_id.value.to_unsigned()
-          ardata["addr"] = self.dut.io_axi_master_read_addr_bits_addr.value.to_unsigned()
-          ardata["size"] = self.dut.io_axi_master_read_addr_bits_size.value.to_unsigned()
-          ardata["len"] = self.dut.io_axi_master_read_addr_bits_len.value.to_unsigned()
-          ardata["burst"] = self.dut.io_axi_master_read_addr_bits_burst.value.to_unsigned()
-          await self.master_arfifo.put(ardata)
+        ardata = dict()
+        ardata["id"] = self.dut.io_axi_master_read_addr_bits_id.value.to_unsigned()
+        ardata["addr"] = self.dut.io_axi_master_read_addr_bits_addr.value.to_unsigned()
+        ardata["size"] = self.dut.io_axi_master_read_addr_bits_size.value.to_unsigned()
+        ardata["len"] = self.dut.io_axi_master_read_addr_bits_len.value.to_unsigned()
+        ardata["burst"] = self.dut.io_axi_master_read_addr_bits_burst.value.to_unsigned()
+        if self.memory_timing:
+          ardata["cycle"] = self._cycle()
+        await self.master_arfifo.put(ardata)
+        if self.stats:
+          self.stats["master"].ar(self._cycle(), ardata["id"], ardata["size"])
+          self._record_depth("master_ar", self.master_arfifo)
+        if self.recorder:
+          self.recorder.record(self._cycle(), AxiPort.MASTER, AxiChannel.AR,
+                               ardata["id"], ardata["addr"], ardata["len"],
+                               ardata["size"], ardata["burst"])
       except Exception as e:
         print('X seen in master_aragent: ' + str(e))
 
   async def master_ragent(self, timeout=4096):
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        self.dut.io_axi_master_read_data_valid.value = 0
-        if self.master_rfifo.qsize():
-          break
-      rdata = await self.master_rfifo.get()
+      await RisingEdge(self.dut.io_aclk)
+      self.dut.io_axi_master_read_data_valid.value = 0
+      rdata = await self._next_item(self.master_rfifo)
       self.dut.io_axi_master_read_data_valid.value = 1
       self.dut.io_axi_master_read_data_bits_id.value = rdata["id"]
       self.dut.io_axi_master_read_data_bits_data.value = rdata["data"]
@@ -330,32 +612,42 @@ class CoreMiniAxiInterface:
         timeout_count += 1
         if timeout_count >= timeout:
           assert False, "timeout waiting for rready"
+      if self.stats:
+        self.stats["master"].r(self._cycle(), rdata["id"], rdata["last"] == 1,
+                               timeout_count)
+        self._record_depth("master_r", self.master_rfifo, 1)
+      if self.recorder:
+        self.recorder.record(self._cycle(), AxiPort.MASTER, AxiChannel.R,
+                             rdata["id"], resp=rdata["resp"],
+                             last=rdata["last"],
+                             data=lane_bytes(rdata["data"]))
 
   async def memory_write_agent(self):
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        if self.master_awfifo.qsize() and self.master_wfifo.qsize():
-          break
       awdata = await self.master_awfifo.get()
       data = []
       strb = []
       while True:
         wdata = await self.master_wfifo.get()
-        line = np.frombuffer(wdata['data'], dtype=np.uint8)
-        data.append(list(reversed(line)))
-        strb.append(list(reversed(wdata['strb'])))
+        data.append(wdata['data'])
+        strb.append(wdata['strb'])
         if wdata['last']:
           break
       assert len(data) == awdata['len'] + 1
       assert len(strb) == awdata['len'] + 1
+      # Beats are captured MSB first, flip each line into byte lane order.
+      data = np.frombuffer(b"".join(data), dtype=np.uint8)
       ret = self.write_memory({
         'addr': awdata['addr'],
         'size': awdata['size'],
         'len': awdata['len'],
-        'data': data,
-        'strb': strb,
+        'burst': awdata['burst'],
+        'data': data.reshape(len(strb), 16)[:, ::-1],
+        'strb': get_masks(strb),
       })
+      if self.memory_timing:
+        await self._wait_until(self.memory_timing.write(
+            awdata["cycle"], wdata["cycle"], awdata["addr"], len(strb)))
       bdata = dict()
       bdata["id"] = awdata["id"]
       bdata["resp"] = AxiResp.OKAY if ret else AxiResp.SLVERR
@@ -364,40 +656,56 @@ class CoreMiniAxiInterface:
   async def master_awagent(self):
     self.dut.io_axi_master_write_addr_ready.value = 1
     while True:
-      await RisingEdge(self.dut.io_aclk)
+      await self._wait_valid(self.dut.io_axi_master_write_addr_valid)
       try:
-        if self.dut.io_axi_master_write_addr_valid.value:
-          awdata = dict()
-          awdata["id"] = self.dut.io_axi_master_write_addr_bits_id.value.to_unsigned()
-          awdata["addr"] = self.dut.io_axi_master_write_addr_bits_addr.value.to_unsigned()
-          awdata["size"] = self.dut.io_axi_master_write_addr_bits_size.value.to_unsigned()
-          awdata["len"] = self.dut.io_axi_master_write_addr_bits_len.value.to_unsigned()
-          await self.master_awfifo.put(awdata)
+        awdata = dict()
+        awdata["id"] = self.dut.io_axi_master_write_addr_bits_id.value.to_unsigned()
+        awdata["addr"] = self.dut.io_axi_master_write_addr_bits_addr.value.to_unsigned()
+        awdata["size"] = self.dut.io_axi_master_write_addr_bits_size.value.to_unsigned()
+        awdata["len"] = self.dut.io_axi_master_write_addr_bits_len.value.to_unsigned()
+        awdata["burst"] = self.dut.io_axi_master_write_addr_bits_burst.value.to_unsigned()
+        if self.memory_timing:
+          awdata["cycle"] = self._cycle()
+        await self.master_awfifo.put(awdata)
+        if self.stats:
+          self.stats["master"].aw(self._cycle(), awdata["id"])
+          self._record_depth("master_aw", self.master_awfifo)
+        if self.recorder:
+          self.recorder.record(self._cycle(), AxiPort.MASTER, AxiChannel.AW,
+                               awdata["id"], awdata["addr"], awdata["len"],
+                               awdata["size"], awdata["burst"])
       except Exception as e:
         print('X seen in master_awagent: ' + str(e))
 
   async def master_wagent(self):
     self.dut.io_axi_master_write_data_ready.value = 1
     while True:
-      await RisingEdge(self.dut.io_aclk)
+      await self._wait_valid(self.dut.io_axi_master_write_data_valid)
       try:
-        if self.dut.io_axi_master_write_data_valid.value:
-          wdata = dict()
-          wdata["data"] = self.dut.io_axi_master_write_data_bits_data.value.buff
-          wdata["strb"] = self.dut.io_axi_master_write_data_bits_strb.value
-          wdata["last"] = self.dut.io_axi_master_write_data_bits_last.value
-          await self.master_wfifo.put(wdata)
+        wdata = dict()
+        wdata["data"] = self.dut.io_axi_master_write_data_bits_data.value.buff
+        wdata["strb"] = self.dut.io_axi_master_write_data_bits_strb.value.to_unsigned()
+        wdata["last"] = self.dut.io_axi_master_write_data_bits_last.value
+        if self.memory_timing:
+          wdata["cycle"] = self._cycle()
+        await self.master_wfifo.put(wdata)
+        if self.stats:
+          self.stats["master"].w(self._cycle(), bin(wdata["strb"]).count("1"),
+                                 wdata["last"] == 1)
+          self._record_depth("master_w", self.master_wfifo)
+        if self.recorder:
+          self.recorder.record(
+              self._cycle(), AxiPort.MASTER, AxiChannel.W,
+              last=wdata["last"].to_unsigned(), strb=wdata["strb"],
+              data=np.frombuffer(wdata["data"], dtype=np.uint8)[::-1])
       except Exception as e:
         print('X seen in master_wagent: ' + str(e))
 
   async def master_bagent(self, timeout=4096):
     while True:
-      while True:
-        await RisingEdge(self.dut.io_aclk)
-        self.dut.io_axi_master_write_resp_valid.value = 0
-        if self.master_bfifo.qsize():
-          break
-      bdata = await self.master_bfifo.get()
+      await RisingEdge(self.dut.io_aclk)
+      self.dut.io_axi_master_write_resp_valid.value = 0
+      bdata = await self._next_item(self.master_bfifo)
       self.dut.io_axi_master_write_resp_valid.value = 1
       self.dut.io_axi_master_write_resp_bits_id.value = bdata["id"]
       self.dut.io_axi_master_write_resp_bits_resp.value = bdata["resp"]
@@ -408,11 +716,20 @@ class CoreMiniAxiInterface:
         timeout_count += 1
         if timeout_count >= timeout:
           assert False, "timeout waiting for bready"
+      if self.stats:
+        self.stats["master"].b(self._cycle(), bdata["id"], timeout_count)
+        self._record_depth("master_b", self.master_bfifo, 1)
+      if self.recorder:
+        self.recorder.record(self._cycle(), AxiPort.MASTER, AxiChannel.B,
+                             bdata["id"], resp=bdata["resp"])
 
   async def reset(self):
     self.dut.io_aresetn.setimmediatevalue(1)
     await Timer(1, unit="us")
     self.dut.io_aresetn.setimmediatevalue(0)
+    # Reset drops any transaction the DUT was still responding to.
+    self.slave_reads_in_flight = 0
+    self.slave_writes_in_flight = 0
     await Timer(1, unit="us")
     self.dut.io_aresetn.setimmediatevalue(1)
     await Timer(1, unit="us")
@@ -483,6 +800,136 @@ class CoreMiniAxiInterface:
     cmderr = (status >> 8) & 0b111
     assert (cmderr == 0)
 
+  async def _read_csr_line(self, addr):
+    """Returns the 16-byte CSR line containing `addr` as four uint32 words."""
+    line = await self.read(self.csr_base_addr + (addr & ~0xF), 16,
+                           max_outstanding=1)
+    return line.view(np.uint32)
+
+  async def _write_csrs(self, writes):
+    """Writes (addr, value) pairs in order, waiting for all responses at once.
+
+    All writes share an AXI ID, so they are applied in order without a round
+    trip between them.
+    """
+    axi_id = random.randint(0,63)
+    for addr, value in writes:
+      data = np.array([value], dtype=np.uint32).view(np.uint8)
+      await self._issue_write_transaction(self.csr_base_addr + addr, data,
+                                          np.ones_like(data, dtype=bool),
+                                          axi_id)
+    for _ in writes:
+      bdata = await self.slave_bfifo.get()
+      assert bdata["id"] == axi_id
+
+  async def _poll_dm_status_line(self, mask, retry_count=1000):
+    """Polls STATUS until a bit of `mask` is set, returning its line's words.
+
+    RSP_OP and STATUS share a line, so word 0 holds the response op.
+    """
+    for _ in range(retry_count):
+      words = await self._read_csr_line(DebugCsrAddr.STATUS)
+      if words[1] & mask:
+        return words
+      await ClockCycles(self.dut.io_aclk, 10)
+    assert False, f"timeout polling debug module status for 0x{mask:x}"
+
+  async def _dm_exchange(self, req, addr, op, data=0):
+    """Performs one debug module request as part of a batch.
+
+    `req` tracks the mailbox state left by the previous request of the batch:
+    REQ_ADDR and REQ_DATA writes are skipped when unchanged, and the previous
+    response is acknowledged in the same burst of writes as this request's
+    arguments. Returns (rsp op, rsp data), with data only read back for
+    DmReqOp.READ.
+    """
+    writes = []
+    if req.get("ack"):
+      writes.append((DebugCsrAddr.STATUS, 0))
+    if req.get("addr") != addr:
+      writes.append((DebugCsrAddr.REQ_ADDR, addr))
+    if op == DmReqOp.WRITE and req.get("data") != data:
+      writes.append((DebugCsrAddr.REQ_DATA, data))
+      req["data"] = data
+    if writes:
+      await self._write_csrs(writes)
+    req["addr"] = addr
+    req["ack"] = True
+
+    # A REQ_OP written while the request isn't ready is dropped.
+    await self._poll_dm_status_line(1)
+    await self._write_csrs([(DebugCsrAddr.REQ_OP, op)])
+    words = await self._poll_dm_status_line(2)
+    rsp_data = None
+    if op == DmReqOp.READ:
+      words_data = await self._read_csr_line(DebugCsrAddr.RSP_DATA)
+      rsp_data = int(words_data[3])
+    return int(words[0]), rsp_data
+
+  async def _dm_access_regs(self, accesses):
+    """Runs abstract register commands for (regno, value) pairs as one batch.
+
+    A value of None reads the register. Returns the values read, with None for
+    writes. cmderr is sticky, so ABSTRACTCS is only checked once at the end.
+    """
+    req = dict()
+    values = []
+    for regno, value in accesses:
+      command = (DmCmdType.ACCESS_REGISTER << 24) | (2 << 20) | (1 << 17) | regno
+      if value is not None:
+        op, _ = await self._dm_exchange(req, DmAddress.DATA0, DmReqOp.WRITE,
+                                        value)
+        assert op == DmRspOp.SUCCESS
+        command |= (1 << 16)
+      op, _ = await self._dm_exchange(req, DmAddress.COMMAND, DmReqOp.WRITE,
+                                      command)
+      assert op == DmRspOp.SUCCESS, f"Access to register 0x{regno:x} failed"
+      if value is None:
+        op, data = await self._dm_exchange(req, DmAddress.DATA0, DmReqOp.READ)
+        assert op == DmRspOp.SUCCESS
+        values.append(data)
+      else:
+        values.append(None)
+    _, status = await self._dm_exchange(req, DmAddress.ABSTRACTCS,
+                                        DmReqOp.READ)
+    await self._write_csrs([(DebugCsrAddr.STATUS, 0)])  # Acknowledge response.
+    cmderr = (status >> 8) & 0b111
+    assert (cmderr == 0)
+    return values
+
+  async def dm_read_regs(self, addrs):
+    """Reads the abstract registers `addrs` in one batch.
+
+    Equivalent to calling dm_read_reg for each address, at a fraction of the
+    CSR traffic.
+    """
+    return await self._dm_access_regs([(addr, None) for addr in addrs])
+
+  async def dm_write_regs(self, regs):
+    """Writes a dict of abstract register address to value in one batch."""
+    await self._dm_access_regs(list(regs.items()))
+
+  async def dm_snapshot_hart(self, include_float=False):
+    """Returns the architectural state of the halted hart.
+
+    The result holds the 32 GPRs as "x", dpc and dcsr, and with
+    `include_float` (only for cores built with floating point) the 32 FPRs
+    as "f".
+    """
+    addrs = [0x1000 + i for i in range(32)]
+    if include_float:
+      addrs += [0x1020 + i for i in range(32)]
+    addrs += [0x7B1, 0x7B0]
+    values = await self.dm_read_regs(addrs)
+    snapshot = {
+        "x": values[0:32],
+        "dpc": values[-2],
+        "dcsr": values[-1],
+    }
+    if include_float:
+      snapshot["f"] = values[32:64]
+    return snapshot
+
   async def dm_request_halt(self):
     dmcontrol = await self.dm_read(DmAddress.DMCONTROL)
     dmcontrol = dmcontrol | (1 << 31) & ~(1 << 30)
@@ -595,13 +1042,13 @@ class CoreMiniAxiInterface:
       beats_sent = beats_sent + 1
     assert beats_sent == beats
 
-  async def _write_transaction(self,
-                               addr: int,
-                               data: np.array,
-                               masks: np.array,
-                               delay_bready: int = 0,
-                               axi_id: int = 0,
-                               burst: AxiBurst = AxiBurst.INCR) -> None:
+  async def _issue_write_transaction(self,
+                                     addr: int,
+                                     data: np.array,
+                                     masks: np.array,
+                                     axi_id: int = 0,
+                                     burst: AxiBurst = AxiBurst.INCR) -> None:
+    """Queues the address and data beats of a write, without waiting for B."""
     # Compute number of beats
     start_addr = addr
     end_addr = addr + len(data) - 1 # Last address written
@@ -616,21 +1063,46 @@ class CoreMiniAxiInterface:
     write_data_task = self._write_data(addr, data, masks, beats)
     await write_addr_task
     await write_data_task
+
+  async def _write_transaction(self,
+                               addr: int,
+                               data: np.array,
+                               masks: np.array,
+                               delay_bready: int = 0,
+                               axi_id: int = 0,
+                               burst: AxiBurst = AxiBurst.INCR) -> None:
+    await self._issue_write_transaction(addr, data, masks, axi_id, burst)
     bdata = await self.slave_bfifo.get()
-    assert bdata["id"].value == axi_id
+    assert bdata["id"] == axi_id
 
   async def _axi_valid_memory_addr(self, addr, data_len) -> bool:
     return (addr >= self.memory_base_addr) and (addr + data_len < self.memory_base_addr + len(self.memory))
 
+  def _transaction_ids(self, max_outstanding):
+    """Returns a generator of AXI IDs, distinct among `max_outstanding`."""
+    assert 1 <= max_outstanding <= 64
+    base_id = random.randint(0,63)
+    return ((base_id + i) % 64 for i in itertools.count())
+
   async def write(self,
                   addr: int,
                   data: np.array,
                   delay_bready: int = 0,
                   masks: np.array = None,
-                  burst: AxiBurst = AxiBurst.INCR) -> None:
-    """Writes data into CoralNPU memory."""
-    axi_id = random.randint(0,63)
+                  burst: AxiBurst = AxiBurst.INCR,
+                  max_outstanding: int = None) -> None:
+    """Writes data into CoralNPU memory.
+
+    Up to `max_outstanding` (default: the constructor argument) transactions
+    are kept in flight, each with a distinct AXI ID. Write responses may
+    arrive in any order.
+    """
+    if max_outstanding is None:
+      max_outstanding = self.max_outstanding
     data = data.view(np.uint8)
+    await self._flush_overlapping(addr, len(data))
+    axi_ids = self._transaction_ids(max_outstanding)
+    in_flight = set()
     if masks is None:
       masks = np.copy(np.ones_like(data, dtype=bool))
     while len(data) > 0:
@@ -638,13 +1110,92 @@ class CoreMiniAxiInterface:
       local_data = data[0:transaction_size]
       local_masks = masks[0:transaction_size]
       if await self._axi_valid_memory_addr(addr, len(local_data)):
-        for i in range(len(local_data)):
-          self.memory[addr - self.memory_base_addr + i] = local_data[i]
+        self.memory.write(addr - self.memory_base_addr, local_data,
+                          local_masks)
+      elif max_outstanding == 1:
+        await self._write_transaction(addr, local_data, local_masks,
+                                      delay_bready, next(axi_ids), burst)
       else:
-        await self._write_transaction(addr, local_data, local_masks, delay_bready, axi_id, burst)
+        if len(in_flight) >= max_outstanding:
+          await self._retire_write(in_flight)
+        axi_id = next(axi_ids)
+        await self._issue_write_transaction(addr, local_data, local_masks,
+                                            axi_id, burst)
+        in_flight.add(axi_id)
       addr += len(local_data)
       data = data[transaction_size:]
       masks = masks[transaction_size:]
+    while in_flight:
+      await self._retire_write(in_flight)
+
+  async def _retire_write(self, in_flight):
+    """Waits for one write response and removes its ID from `in_flight`."""
+    bdata = await self.slave_bfifo.get()
+    assert bdata["id"] in in_flight
+    in_flight.remove(bdata["id"])
+
+  async def write_buffered(self, addr: int, data: np.array) -> None:
+    """Writes data into CoralNPU memory through the write-combining buffer.
+
+    With `write_combining` set, the write is only buffered. Buffered writes
+    are merged into as few aligned bursts as possible by `flush_writes`, which
+    runs before execution starts and before any access overlapping them.
+    """
+    if not self.write_combining:
+      await self.write(addr, data)
+      return
+    # Held until the flush, so take a copy the caller can't modify.
+    self.pending_writes.append(
+        (addr, np.array(data).view(np.uint8).reshape(-1)))
+
+  def _combine_writes(self):
+    """Returns pending writes merged into (addr, data, masks) runs.
+
+    Writes which overlap or touch neighbouring 16-byte lines are merged, with
+    later writes taking precedence, and unwritten bytes masked off.
+    """
+    order = sorted(range(len(self.pending_writes)),
+                   key=lambda i: self.pending_writes[i][0])
+    groups = []
+    for i in order:
+      addr, data = self.pending_writes[i]
+      if len(data) == 0:
+        continue
+      end = addr + len(data)
+      if groups and (addr // 16) <= (groups[-1][1] - 1) // 16 + 1:
+        groups[-1][1] = max(groups[-1][1], end)
+        groups[-1][2].append(i)
+      else:
+        groups.append([addr, end, [i]])
+    runs = []
+    for lo, hi, indices in groups:
+      data = np.zeros([hi - lo], dtype=np.uint8)
+      masks = np.zeros([hi - lo], dtype=bool)
+      for i in sorted(indices):
+        addr, segment = self.pending_writes[i]
+        data[addr - lo:addr - lo + len(segment)] = segment
+        masks[addr - lo:addr - lo + len(segment)] = True
+      runs.append((lo, data, masks))
+    return runs
+
+  async def flush_writes(self):
+    """Issues all buffered writes."""
+    if not self.pending_writes:
+      return
+    runs = self._combine_writes()
+    self.pending_writes = []
+    for addr, data, masks in runs:
+      await self.write(addr, data, masks=masks)
+
+  def discard_writes(self):
+    """Drops buffered writes, e.g. when restoring memory."""
+    self.pending_writes = []
+
+  async def _flush_overlapping(self, addr, size):
+    for pending_addr, data in self.pending_writes:
+      if pending_addr < addr + size and addr < pending_addr + len(data):
+        await self.flush_writes()
+        return
 
   async def write_word(self, addr: int, data: int) -> None:
     axi_id = random.randint(0,63)
@@ -664,16 +1215,20 @@ class CoreMiniAxiInterface:
     ardata["burst"] = burst
     await self.slave_arfifo.put(ardata)
 
-  async def _read_data(self, expected_resp=AxiResp.OKAY, axi_id=0):
+  async def _read_data(self, expected_resp=AxiResp.OKAY, axi_id=0, xmask=False):
+    """Returns (last, data) for the next read beat, in byte lane order.
+
+    If `xmask` is set, returns (last, data, xmask) where xmask flags the bits
+    of the beat that were X or Z.
+    """
     rdata = await self.slave_rfifo.get()
-    data = np.frombuffer(
-        rdata["data"],
-        dtype=np.uint8)
     last = rdata["last"]
     assert rdata["resp"] == expected_resp
     assert rdata["id"] == axi_id
 
-    return last, np.flip(data)
+    if xmask:
+      return last, rdata["data"][::-1], rdata["xmask"][::-1]
+    return last, rdata["data"][::-1]
 
   async def _read_transaction(self,
                               addr: int,
@@ -681,47 +1236,149 @@ class CoreMiniAxiInterface:
                               expected_resp: AxiResp = AxiResp.OKAY,
                               axi_id: int = 0,
                               burst: AxiBurst = AxiBurst.INCR):
-    # Compute number of beats
-    start_addr = addr
-    end_addr = addr + bytes_to_read - 1 # Last address written
-    start_line = start_addr // 16
-    end_line = end_addr // 16
+    out = np.empty([bytes_to_read], dtype=np.uint8)
+    await self._read_transaction_into(addr, out, expected_resp, axi_id, burst)
+    return out
+
+  async def _read_transaction_into(self,
+                                   addr: int,
+                                   out: np.array,
+                                   expected_resp: AxiResp = AxiResp.OKAY,
+                                   axi_id: int = 0,
+                                   burst: AxiBurst = AxiBurst.INCR):
+    """Reads len(out) bytes in one transaction, decoding beats into `out`."""
+    start_line = addr // 16
+    end_line = (addr + len(out) - 1) // 16
     beats = (end_line - start_line) + 1
     await self._read_addr(start_line * 16, 4, beats, axi_id, burst)
-    data = []
-    bytes_remaining = bytes_to_read
+    offset = 0
     for beat in range(beats):
-      base_addr = (addr // 16) * 16
-      sub_addr = addr - base_addr
       (last, beat_data) = await self._read_data(expected_resp, axi_id)
-      beat_data = beat_data[sub_addr:]
-      if len(beat_data) > bytes_remaining:
-        beat_data = beat_data[0:bytes_remaining]
-      data.append(beat_data)
-      bytes_remaining = bytes_remaining - len(beat_data)
-      addr = addr + len(beat_data)
+      beat_data = beat_data[addr % 16:][:len(out) - offset]
+      out[offset:offset + len(beat_data)] = beat_data
+      offset += len(beat_data)
+      addr += len(beat_data)
       if beat == (beats - 1):
         assert last
-    return np.concatenate(data)
 
-  async def read(self, addr, bytes_to_read, burst: AxiBurst=AxiBurst.INCR):
-    """Reads data from CoralNPU Memory."""
-    axi_id = random.randint(0,63)
-    data = []
-    while bytes_to_read > 0:
-      transaction_size = self._determine_transaction_size(addr, bytes_to_read)
+  def _local_view(self, addr, size):
+    """Returns a read-only view of the local memory model, or None."""
+    if size == 0 or not (addr >= self.memory_base_addr and
+                         addr + size < self.memory_base_addr + len(self.memory)):
+      return None
+    view = self.memory.read(addr - self.memory_base_addr, size)
+    view.flags.writeable = False
+    return view
+
+  async def read(self,
+                 addr,
+                 bytes_to_read,
+                 burst: AxiBurst=AxiBurst.INCR,
+                 max_outstanding: int = None):
+    """Reads data from CoralNPU Memory.
+
+    Up to `max_outstanding` (default: the constructor argument) transactions
+    are kept in flight, each with a distinct AXI ID. Read data is reassembled
+    by ID, so beats may be returned in any order.
+    """
+    out = np.empty([bytes_to_read], dtype=np.uint8)
+    return await self.read_into(addr, out, burst, max_outstanding)
+
+  async def read_array(self, addr, dtype, shape):
+    """Reads an array of `dtype` and `shape` from CoralNPU Memory.
+
+    Ranges held by the local memory model are returned as a read-only view of
+    the model rather than a copy. Such a view changes with later writes and
+    isn't updated by a memory restore, so copy it to keep the data.
+    """
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    await self._flush_overlapping(addr, size)
+    view = self._local_view(addr, size)
+    if view is None:
+      return await self.read_into(addr, np.empty(shape, dtype=dtype))
+    return view.view(dtype).reshape(shape)
+
+  async def read_into(self,
+                      addr,
+                      out: np.array,
+                      burst: AxiBurst=AxiBurst.INCR,
+                      max_outstanding: int = None):
+    """Reads out.nbytes bytes from CoralNPU Memory into `out`, and returns it.
+
+    `out` may have any dtype and shape, but must be C-contiguous. Read beats
+    are decoded straight into it, without intermediate arrays.
+    """
+    if max_outstanding is None:
+      max_outstanding = self.max_outstanding
+    assert out.flags.c_contiguous and out.flags.writeable
+    buf = out.reshape(-1).view(np.uint8)
+    await self._flush_overlapping(addr, len(buf))
+    axi_ids = self._transaction_ids(max_outstanding)
+    if max_outstanding > 1:
+      await self._read_pipelined(addr, buf, burst, max_outstanding, axi_ids)
+      return out
+    axi_id = next(axi_ids)
+    offset = 0
+    while offset < len(buf):
+      transaction_size = self._determine_transaction_size(
+          addr, len(buf) - offset)
+      local = buf[offset:offset + transaction_size]
+      if await self._axi_valid_memory_addr(addr, transaction_size):
+        local[:] = self.memory.read(addr - self.memory_base_addr,
+                                    transaction_size)
+      else:
+        await self._read_transaction_into(addr, local, 0, axi_id, burst)
+      addr += transaction_size
+      offset += transaction_size
+    return out
+
+  async def _read_pipelined(self, addr, out, burst, max_outstanding, axi_ids):
+    bytes_to_read = len(out)
+    # Maps AXI ID to [next address, offset in `out`, bytes remaining].
+    in_flight = dict()
+    offset = 0
+    while offset < bytes_to_read:
+      transaction_size = self._determine_transaction_size(
+          addr, bytes_to_read - offset)
       if await self._axi_valid_memory_addr(addr, transaction_size):
         rel_addr = addr - self.memory_base_addr
-        data.append(self.memory[rel_addr : rel_addr + transaction_size])
+        out[offset:offset + transaction_size] = \
+            self.memory.read(rel_addr, transaction_size)
       else:
-        data.append(await self._read_transaction(addr, transaction_size, 0, axi_id, burst))
-      bytes_to_read -= transaction_size
+        if len(in_flight) >= max_outstanding:
+          await self._retire_read(in_flight, out)
+        axi_id = next(axi_ids)
+        start_line = addr // 16
+        beats = ((addr + transaction_size - 1) // 16) - start_line + 1
+        await self._read_addr(start_line * 16, 4, beats, axi_id, burst)
+        in_flight[axi_id] = [addr, offset, transaction_size]
       addr += transaction_size
-    if len(data) == 0 :
-      return data
-    return np.concatenate(data)
+      offset += transaction_size
+    while in_flight:
+      await self._retire_read(in_flight, out)
+    return out
+
+  async def _retire_read(self, in_flight, out, expected_resp=AxiResp.OKAY):
+    """Places read beats into `out` until one transaction in `in_flight` ends."""
+    while True:
+      rdata = await self.slave_rfifo.get()
+      axi_id = int(rdata["id"])
+      assert axi_id in in_flight
+      assert rdata["resp"] == expected_resp
+      state = in_flight[axi_id]
+      addr, offset, remaining = state
+      beat_data = rdata["data"][::-1]
+      beat_data = beat_data[addr % 16:][:remaining]
+      out[offset:offset + len(beat_data)] = beat_data
+      state[:] = [addr + len(beat_data), offset + len(beat_data),
+                  remaining - len(beat_data)]
+      if rdata["last"]:
+        assert state[2] == 0
+        del in_flight[axi_id]
+        return
 
   async def read_word(self, addr, expected_resp=AxiResp.OKAY):
+    await self._flush_overlapping(addr, 4)
     axi_id = random.randint(0,63)
     data = []
     offset = addr % 16
@@ -731,21 +1388,66 @@ class CoreMiniAxiInterface:
     data.append(beat_data[offset:offset+4])
     return np.concatenate(data)
 
-  async def load_elf(self, f):
-    """Loads an ELF file into DUT memory, and returns the entry point address."""
-    elf_file = ELFFile(f)
-    entry_point = elf_file.header["e_entry"]
-    for segment in elf_file.iter_segments(type="PT_LOAD"):
-      header = segment.header
-      data = np.frombuffer(segment.data(), dtype=np.uint8)
-      if self._axi_memory_contains(header["p_paddr"]) and \
-         self._axi_memory_contains(header["p_paddr"] + len(data) -1):
-        memory_start = header["p_paddr"] - self.memory_base_addr
-        memory_end = memory_start + len(data)
-        self.memory[memory_start:memory_end] = data
+  def _tcm_backdoor(self, addr, size):
+    """Returns the TcmBackdoor containing a range, or None."""
+    if self.tcm_backdoors is None:
+      self.tcm_backdoors = []
+      for name, base_addr, tcm_size in self.tcm_regions:
+        backdoor = TcmBackdoor.find(self.dut, name, base_addr, tcm_size)
+        if backdoor is not None:
+          self.tcm_backdoors.append(backdoor)
+    for backdoor in self.tcm_backdoors:
+      if backdoor.contains(addr, size):
+        return backdoor
+    return None
+
+  async def write_backdoor(self, addr: int, data: np.array) -> None:
+    """Writes data directly into TCM SRAM, bypassing the AXI slave port.
+
+    Falls back to `write` if the range isn't in a TCM whose SRAM arrays are
+    visible to the simulator.
+    """
+    data = data.view(np.uint8)
+    await self._flush_overlapping(addr, len(data))
+    backdoor = self._tcm_backdoor(addr, len(data))
+    if backdoor is None or len(data) == 0:
+      await self.write(addr, data)
+      return
+    backdoor.write(addr, data)
+    if self.recorder:
+      self.recorder.record_backdoor(self._cycle(), addr, data)
+
+  async def read_backdoor(self, addr: int, bytes_to_read: int):
+    """Reads data directly from TCM SRAM, falling back to `read`."""
+    await self._flush_overlapping(addr, bytes_to_read)
+    backdoor = self._tcm_backdoor(addr, bytes_to_read)
+    if backdoor is None or bytes_to_read == 0:
+      return await self.read(addr, bytes_to_read)
+    return backdoor.read(addr, bytes_to_read)
+
+  async def load_elf(self, f, backdoor=None):
+    """Loads an ELF file into DUT memory, and returns the entry point address.
+
+    If `backdoor` (default: the `backdoor_load` constructor argument) is set,
+    TCM segments are written directly into the SRAM arrays when possible.
+    """
+    if backdoor is None:
+      backdoor = self.backdoor_load
+    image = load_elf_image(f)
+    # Segments loaded through the slave port, as (address, size) pairs.
+    self.loaded_segments = []
+    for paddr, data in image.segments:
+      if self._axi_memory_contains(paddr) and \
+         self._axi_memory_contains(paddr + len(data) -1):
+        self.memory.write(paddr - self.memory_base_addr, data)
         continue
-      await self.write(header["p_paddr"], data)
-    return entry_point
+      if backdoor:
+        await self.write_backdoor(paddr, data)
+      else:
+        await self.write(paddr, data)
+      if len(data):
+        self.loaded_segments.append((paddr, len(data)))
+    return image.entry_point
 
   def _axi_memory_contains(self, x):
     """Checks if an address is contained in the AXI memory region"""
@@ -753,40 +1455,65 @@ class CoreMiniAxiInterface:
         (x < (self.memory_base_addr + len(self.memory)))
 
   def lookup_symbol(self, f, symbol_name):
-    elf_file = ELFFile(f)
-    symtab_section = next(elf_file.iter_sections(type='SHT_SYMTAB'))
-    i1 = symtab_section.get_symbol_by_name(symbol_name)
-    if i1:
-      return i1[0].entry['st_value']
-    return None
+    return load_elf_image(f).lookup_symbol(symbol_name)
+
+  def _burst_lines(self, addr, size, length, burst):
+    """Returns the memory offset of the 16-byte line touched by each beat.
+
+    Returns None if any beat of the burst falls outside of memory.
+    """
+    addrs = axi_burst_addresses(addr, size, length, burst)
+    lines = (addrs & ~0xF) - self.memory_base_addr
+    if lines.min() < 0 or lines.max() + 16 > len(self.memory):
+      return None
+    return lines
 
   def write_memory(self, wdata):
-    """Write `wdata` to memory."""
-    addr = int(wdata["addr"])
-    data = wdata["data"]
-    strb = wdata["strb"]
-    if addr < self.memory_base_addr or addr >= (self.memory_base_addr + len(self.memory)):
+    """Write the burst `wdata` to memory.
+
+    `wdata["data"]` and `wdata["strb"]` hold one row of 16 byte lanes per beat.
+    The whole burst is committed with one masked assignment per page.
+    """
+    length = int(wdata["len"])
+    lines = self._burst_lines(int(wdata["addr"]), int(wdata["size"]), length,
+                              wdata.get("burst", AxiBurst.INCR))
+    if lines is None:
       return False
-    line_start = (addr - self.memory_base_addr) & 0xFFFFFFF0
-    flat_data = list(itertools.chain(*data))
-    flat_strb = list(itertools.chain(*strb))
-    for i in range(0,len(flat_data)):
-      if flat_strb[i] == 1:
-        self.memory[line_start + i] = flat_data[i]
+    if self.memory_watches:
+      lo = lines.min()
+      hi = lines.max() + 16
+      for start, end, event in self.memory_watches:
+        if start < hi and lo < end:
+          event.set()
+    data = np.asarray(wdata["data"], dtype=np.uint8).reshape(length + 1, 16)
+    strb = np.asarray(wdata["strb"], dtype=bool).reshape(length + 1, 16)
+    start = lines[0]
+    if (lines == start + np.arange(length + 1) * 16).all():
+      # Contiguous full-width INCR burst, write straight into pages.
+      self.memory.write(start, data.reshape(-1), strb.reshape(-1))
+    else:
+      offsets = lines[:, np.newaxis] + np.arange(16)
+      self.memory[offsets[strb]] = data[strb]
     return True
 
   def read_memory(self, raddr):
-    addr = int(raddr["addr"])
-    size = (2 ** raddr["size"])
-    if addr < self.memory_base_addr or addr >= (self.memory_base_addr + len(self.memory)):
+    """Returns the 16-byte line for every beat of the read burst `raddr`.
+
+    The result is a [beats, 16] array in byte lane order, or None if the burst
+    falls outside of memory.
+    """
+    length = int(raddr["len"])
+    lines = self._burst_lines(int(raddr["addr"]), int(raddr["size"]), length,
+                              raddr.get("burst", AxiBurst.INCR))
+    if lines is None:
       return None
-    offset = (addr - self.memory_base_addr)
-    data = self.memory[offset:offset+size]
-    padded_data = pad_to_multiple(data, 16)
-    line_shift = addr % 16
-    return np.roll(padded_data.view(np.uint8), line_shift)
+    start = lines[0]
+    if (lines == start + np.arange(length + 1) * 16).all():
+      return self.memory[start:start + (length + 1) * 16].reshape(length + 1, 16)
+    return self.memory[lines[:, np.newaxis] + np.arange(16)]
 
   async def execute_from(self, start_pc):
+    await self.flush_writes()
     # Program starting address
     coralnpu_pc_csr_addr = self.csr_base_addr + 4
     await self.write_word(coralnpu_pc_csr_addr, start_pc)
@@ -796,9 +1523,49 @@ class CoreMiniAxiInterface:
     # Release reset
     await self.write_word(coralnpu_reset_csr_addr, 0)
 
+  def _status_signals(self):
+    return {
+        "halted": self.dut.io_halted,
+        "fault": self.dut.io_fault,
+        "wfi": self.dut.io_wfi,
+    }
+
+  async def wait_for_status(self,
+                            conditions=("halted", "fault", "wfi"),
+                            timeout_cycles=None):
+    """Waits until one of the named status outputs is high.
+
+    Suspends on the rising edges of the `conditions` ("halted", "fault" and/or
+    "wfi") and an optional timeout timer, so no Python runs while the core is
+    busy. The cycle count is computed from simulation time.
+
+    Returns:
+      (condition, cycle_count), where condition is the first of `conditions`
+      found high, or None if `timeout_cycles` elapsed first.
+    """
+    signals = self._status_signals()
+    def fired():
+      for condition in conditions:
+        if signals[condition].value == 1:
+          return condition
+      return None
+
+    condition = fired()
+    if condition is not None:
+      return condition, 0
+    start_ps = get_sim_time(unit="ps")
+    triggers = [RisingEdge(signals[c]) for c in conditions]
+    if timeout_cycles is not None:
+      triggers.append(Timer(timeout_cycles * self.clock_period_ps, unit="ps"))
+    await First(*triggers)
+    # Resume on a clock edge, as the per-cycle polling loops used to.
+    await RisingEdge(self.dut.io_aclk)
+    cycle_count = round(
+        (get_sim_time(unit="ps") - start_ps) / self.clock_period_ps)
+    return fired(), cycle_count
+
   async def wait_for_wfi(self):
-    while self.dut.io_wfi.value != 1:
-      await ClockCycles(self.dut.io_aclk, 1)
+    await self.wait_for_status(("wfi",))
 
   async def raise_irq(self, cycles=1):
     self.dut.io_irq.value = 1
@@ -806,32 +1573,78 @@ class CoreMiniAxiInterface:
     self.dut.io_irq.value = 0
 
   async def wait_for_halted(self, timeout_cycles=1000):
-    cycle_count = 0
-    while self.dut.io_halted.value != 1 and timeout_cycles > 0:
-      await ClockCycles(self.dut.io_aclk, 1)
-      timeout_cycles = timeout_cycles - 1
-      cycle_count += 1
-    assert timeout_cycles > 0
+    condition, cycle_count = await self.wait_for_status(("halted",),
+                                                        timeout_cycles)
+    assert condition is not None
     return cycle_count
 
-  async def wait_for_halted_semihost(self, elf, timeout_cycles=1000000):
-    tohost = self.lookup_symbol(elf, "tohost")
-    assert tohost != None
+  async def _wait_for_change(self, read, wake, timeout_cycles):
+    """Waits until `read()` returns a value different from its first result.
+
+    `read` is only re-evaluated when the trigger returned by `wake()` fires,
+    so nothing runs in Python while the value is unchanged.
+    """
+    initial = read().copy()
+    deadline_ps = get_sim_time(unit="ps") + \
+        timeout_cycles * self.clock_period_ps
+    while True:
+      trigger = wake()
+      current = read()
+      if not (current == initial).all():
+        return current.copy()
+      remaining_ps = deadline_ps - get_sim_time(unit="ps")
+      assert remaining_ps > 0, "timeout waiting for value to change"
+      await First(trigger, Timer(remaining_ps, unit="ps"))
+
+  async def wait_for_tohost(self, tohost, timeout_cycles=1000000):
+    """Waits for the core to write the word at `tohost`, returning its value.
+
+    Writes to external memory are seen in `write_memory`, and writes to a TCM
+    with a visible backdoor wake on the SRAM word itself. Neither issues any
+    bus traffic. Otherwise falls back to polling through the slave port.
+    """
+    if self._axi_memory_contains(tohost):
+      offset = tohost - self.memory_base_addr
+      event = Event()
+      watch = (offset, offset + 4, event)
+      self.memory_watches.append(watch)
+      def wake():
+        event.clear()
+        return event.wait()
+      try:
+        return await self._wait_for_change(
+            lambda: self.memory[offset:offset + 4], wake, timeout_cycles)
+      finally:
+        self.memory_watches.remove(watch)
+
+    backdoor = self._tcm_backdoor(tohost, 4)
+    if backdoor is not None:
+      # Only the SRAM word holding tohost is read on each change.
+      line = backdoor.line_handle(tohost)
+      offset = tohost % 16
+      def read_tohost():
+        data = line.value.resolve("zeros").to_bytes(byteorder="little")
+        return np.frombuffer(data[offset:offset + 4], dtype=np.uint8)
+      return await self._wait_for_change(
+          read_tohost, lambda: ValueChange(line), timeout_cycles)
+
     initial_rv = await self.read_word(tohost)
     while True:
       await ClockCycles(self.dut.io_aclk, 1)
       rv = await self.read_word(tohost)
       if not (rv == initial_rv).all():
-        assert np.sum(rv) == 1
-        break
+        return rv
       timeout_cycles = timeout_cycles - 1
       assert timeout_cycles > 0
 
+  async def wait_for_halted_semihost(self, elf, timeout_cycles=1000000):
+    tohost = load_elf_image(elf).tohost
+    assert tohost != None
+    rv = await self.wait_for_tohost(tohost, timeout_cycles)
+    assert np.sum(rv) == 1
+
   async def wait_for_fault(self, timeout_cycles=1000):
-    cycle_count = 0
-    while self.dut.io_fault.value != 1 and timeout_cycles > 0:
-      await ClockCycles(self.dut.io_aclk, 1)
-      timeout_cycles = timeout_cycles - 1
-      cycle_count += 1
-    assert timeout_cycles > 0
+    condition, cycle_count = await self.wait_for_status(("fault",),
+                                                        timeout_cycles)
+    assert condition is not None
     return cycle_count
@@ -38,6 +38,7 @@ class CoreMiniAxiDebugOps(Enum):
     SET_BREAKPOINT = 4
     REMOVE_BREAKPOINT = 5
     STEP = 6
+    READ_REGS = 7
 
 class CoreMiniAxiProbe(DebugProbe):
     def __init__(self, session):
@@ -245,42 +246,39 @@ class CoreMiniAxiTarget(Target):
         return rsp
 
     def read_core_registers_raw(self, reg_list):
-        ret = []
+        # Map from gdb register to DM register, None for unsupported ones.
+        dm_regs = []
         for reg in reg_list:
             if reg == 261: # ARM IPSR
-                ret.append(0)
-            # if type(reg) == str:
+                dm_regs.append(None)
+                continue
+            reg_str_to_int = {
+                'r7': 7,
+                'sp': 2,
+                'lr': 1,
+                'pc': 32,
+            }
+            if type(reg) == str:
+                reg = reg_str_to_int[reg]
+
+            if reg == 32: # PC
+                dm_regs.append(0x7B1)
+            elif reg >= 0 and reg < 31: # Scalar
+                dm_regs.append(reg + 0x1000)
+            elif reg >= 33 and reg < 65: # Float
+                dm_regs.append((reg - 33) + 0x1020)
+            elif reg >= 65 and reg < 68: # Floating CSRs
+                dm_regs.append(reg - 65 + 1)
             else:
-                reg_str_to_int = {
-                    'r7': 7,
-                    'sp': 2,
-                    'lr': 1,
-                    'pc': 32,
-                }
-                if type(reg) == str:
-                    reg = reg_str_to_int[reg]
-
-                # Map from gdb register to DM register
-                if reg == 32: # PC
-                    reg = 0x7B1
-                elif reg >= 0 and reg < 31: # Scalar
-                    reg = reg + 0x1000
-                elif reg >= 33 and reg < 65: # Float
-                    reg = (reg - 33) + 0x1020
-                elif reg >= 65 and reg < 68: # Floating CSRs
-                    reg = (reg - 65 + 1)
-                else:
-                    ret.append(0)
-                    continue
-
-                e = threading.Event()
-                self.q.put((CoreMiniAxiDebugOps.READ_REG, e, {
-                    'addr': reg,
-                }))
-                rv = self.q_rsp.get()
-                ret.append(rv)
+                dm_regs.append(None)
 
-        return ret
+        # Read all the registers in a single batch.
+        e = threading.Event()
+        self.q.put((CoreMiniAxiDebugOps.READ_REGS, e, {
+            'addrs': [reg for reg in dm_regs if reg is not None],
+        }))
+        values = iter(self.q_rsp.get())
+        return [0 if reg is None else next(values) for reg in dm_regs]
 
     def resume(self):
         e = threading.Event()
@@ -412,6 +410,9 @@ class CoreMiniAxiGDBServer(object):
             if t == CoreMiniAxiDebugOps.READ_REG:
                 data = await self.core_mini_axi.dm_read_reg(kwargs['addr'])
                 gdbserver_queue_rsp.put(data)
+            if t == CoreMiniAxiDebugOps.READ_REGS:
+                data = await self.core_mini_axi.dm_read_regs(kwargs['addrs'])
+                gdbserver_queue_rsp.put(data)
             if t == CoreMiniAxiDebugOps.RESUME:
                 bp_triggered = False
                 await self.core_mini_axi.dm_request_resume()
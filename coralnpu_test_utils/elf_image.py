@@ -0,0 +1,126 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+from elftools.elf.elffile import ELFFile
+
+
+# If set, parsed images are also persisted as pickles in this directory.
+ELF_CACHE_DIR_ENV = "CORALNPU_ELF_CACHE_DIR"
+
+
+class ElfImage:
+  """The parts of an ELF file needed to load and run it.
+
+  Attributes:
+    entry_point: The ELF entry point.
+    segments: List of (physical address, np.uint8 data) for PT_LOAD segments.
+    symbols: Dict of symbol name to value from .symtab.
+  """
+
+  def __init__(self, entry_point, segments, symbols):
+    self.entry_point = entry_point
+    self.segments = segments
+    self.symbols = symbols
+
+  @classmethod
+  def from_file(cls, f):
+    """Parses an open ELF file."""
+    elf_file = ELFFile(f)
+    segments = []
+    for segment in elf_file.iter_segments(type="PT_LOAD"):
+      data = np.frombuffer(segment.data(), dtype=np.uint8)
+      segments.append((segment.header["p_paddr"], data))
+    symbols = {}
+    for symtab in elf_file.iter_sections(type="SHT_SYMTAB"):
+      for symbol in symtab.iter_symbols():
+        if symbol.name:
+          symbols.setdefault(symbol.name, symbol.entry["st_value"])
+    return cls(elf_file.header["e_entry"], segments, symbols)
+
+  @property
+  def tohost(self):
+    return self.symbols.get("tohost")
+
+  def lookup_symbol(self, symbol_name):
+    return self.symbols.get(symbol_name)
+
+
+_elf_image_cache = {}
+
+
+def _cache_key(path):
+  st = os.stat(path)
+  return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def _load_persisted(cache_dir, key):
+  name = hashlib.sha256(repr(key).encode()).hexdigest() + ".pkl"
+  cache_path = os.path.join(cache_dir, name)
+  try:
+    with open(cache_path, "rb") as f:
+      cached_key, image = pickle.load(f)
+    if cached_key == key:
+      return image, cache_path
+  except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+    pass
+  return None, cache_path
+
+
+def _persist(cache_path, key, image):
+  os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+  tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+  with open(tmp_path, "wb") as f:
+    pickle.dump((key, image), f)
+  os.replace(tmp_path, cache_path)
+
+
+def load_elf_image(f, cache_dir=None):
+  """Returns the ElfImage for an ELF path or open file.
+
+  Images are cached by path, size and modification time, so repeated loads and
+  symbol lookups of the same file only parse it once. If `cache_dir` (default:
+  the CORALNPU_ELF_CACHE_DIR environment variable) is set, images are also
+  persisted there so later runs skip parsing entirely. Files without a path
+  on disk are parsed every time.
+  """
+  path = f if isinstance(f, (str, os.PathLike)) else getattr(f, "name", None)
+  if not isinstance(path, (str, os.PathLike)) or not os.path.isfile(path):
+    f.seek(0)
+    return ElfImage.from_file(f)
+
+  key = _cache_key(path)
+  image = _elf_image_cache.get(key)
+  if image is not None:
+    return image
+
+  if cache_dir is None:
+    cache_dir = os.environ.get(ELF_CACHE_DIR_ENV)
+  cache_path = None
+  if cache_dir:
+    image, cache_path = _load_persisted(cache_dir, key)
+
+  if image is None:
+    with open(path, "rb") as elf_file:
+      image = ElfImage.from_file(elf_file)
+    if cache_path:
+      _persist(cache_path, key, image)
+
+  _elf_image_cache[key] = image
+  return image
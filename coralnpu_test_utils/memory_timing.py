@@ -0,0 +1,126 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+
+class MemoryTiming:
+  """Timing parameters of the external memory, in AXI clock cycles.
+
+  Attributes:
+    read_latency: Cycles from AR to the first R beat on a row hit.
+    write_latency: Cycles from the last W beat to B on a row hit.
+    beat_cycles: Cycles per data beat, i.e. the inverse of the bandwidth.
+    max_outstanding_reads: Reads serviced concurrently; later ARs wait.
+    max_outstanding_writes: Writes serviced concurrently; later AWs wait.
+    banks: Number of banks, interleaved every `row_bytes`.
+    row_bytes: Bytes per row of a bank.
+    row_miss_penalty: Extra cycles for an access to a row that isn't open.
+  """
+
+  def __init__(self,
+               read_latency=20,
+               write_latency=10,
+               beat_cycles=1,
+               max_outstanding_reads=8,
+               max_outstanding_writes=8,
+               banks=8,
+               row_bytes=2048,
+               row_miss_penalty=14):
+    assert beat_cycles >= 1
+    assert max_outstanding_reads >= 1 and max_outstanding_writes >= 1
+    self.read_latency = read_latency
+    self.write_latency = write_latency
+    self.beat_cycles = beat_cycles
+    self.max_outstanding_reads = max_outstanding_reads
+    self.max_outstanding_writes = max_outstanding_writes
+    self.banks = banks
+    self.row_bytes = row_bytes
+    self.row_miss_penalty = row_miss_penalty
+
+
+class MemoryTimingModel:
+  """Schedules external memory transactions according to a MemoryTiming.
+
+  Data for all transactions shares one bus and is returned in the order the
+  requests were scheduled, which also keeps responses of each AXI ID in
+  order. Each bank keeps its last accessed row open.
+  """
+
+  def __init__(self, timing):
+    self.timing = timing
+    self.open_rows = [None] * timing.banks
+    self.bank_free = [0] * timing.banks
+    self.bus_free = 0
+    # Completion cycles of the transactions in service, per direction.
+    self.in_service = {
+        "read": collections.deque(),
+        "write": collections.deque(),
+    }
+    self.row_hits = 0
+    self.row_misses = 0
+
+  def _bank_row(self, addr):
+    row = addr // self.timing.row_bytes
+    return row % self.timing.banks, row // self.timing.banks
+
+  def _access(self, kind, start, addr, beats, latency, max_outstanding):
+    """Returns (first beat cycle, last beat cycle) of an access."""
+    in_service = self.in_service[kind]
+    while in_service and in_service[0] <= start:
+      in_service.popleft()
+    if len(in_service) >= max_outstanding:
+      # Wait for the oldest transaction in service to complete.
+      start = max(start, in_service[-max_outstanding])
+    bank, row = self._bank_row(addr)
+    start = max(start, self.bank_free[bank])
+    penalty = 0
+    if self.open_rows[bank] == row:
+      self.row_hits += 1
+    else:
+      self.row_misses += 1
+      penalty = self.timing.row_miss_penalty
+      self.open_rows[bank] = row
+    first = max(start + penalty + latency, self.bus_free)
+    last = first + (beats - 1) * self.timing.beat_cycles
+    self.bus_free = last + self.timing.beat_cycles
+    # The bank is busy opening the row and bursting, while accesses to the
+    # open row are pipelined behind each other.
+    self.bank_free[bank] = start + penalty + beats * self.timing.beat_cycles
+    in_service.append(last)
+    return first, last
+
+  def read(self, ar_cycle, addr, beats):
+    """Returns the cycle of the first R beat for a read issued at `ar_cycle`."""
+    first, _ = self._access("read", ar_cycle, addr, beats,
+                            self.timing.read_latency,
+                            self.timing.max_outstanding_reads)
+    return first
+
+  def write(self, aw_cycle, last_w_cycle, addr, beats):
+    """Returns the cycle of the B response for a write.
+
+    The data is written over the bus once the address arrives and the write
+    completes once all beats were received.
+    """
+    _, last = self._access("write", aw_cycle, addr, beats,
+                           self.timing.write_latency,
+                           self.timing.max_outstanding_writes)
+    return max(last, last_w_cycle + self.timing.write_latency)
+
+  def stats(self):
+    return {
+        "row_hits": self.row_hits,
+        "row_misses": self.row_misses,
+    }
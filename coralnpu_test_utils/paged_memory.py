@@ -0,0 +1,215 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+
+class PagedMemory:
+  """A sparse byte array made of lazily allocated, fixed-size numpy pages.
+
+  Pages are only allocated on first write. Reads from untouched pages return
+  the fill pattern. Supports integer, contiguous slice and integer array
+  indexing with offsets relative to the start of the memory, so it can be used
+  in place of a dense `np.uint8` array.
+
+  `snapshot()` shares every page with the returned snapshot. Pages are copied
+  on their first write afterwards, so `restore()` only has to swap back the
+  pages that were written since the snapshot was taken.
+  """
+
+  def __init__(self, size, page_size=4096, fill=0):
+    assert page_size > 0 and (page_size & (page_size - 1)) == 0, \
+        "page_size must be a power of two"
+    self.size = size
+    self.page_size = page_size
+    self.page_shift = page_size.bit_length() - 1
+    self.page_mask = page_size - 1
+    if isinstance(fill, int):
+      fill = bytes([fill])
+    self.fill_page = np.resize(np.frombuffer(bytes(fill), dtype=np.uint8),
+                               page_size)
+    self.fill_page.flags.writeable = False
+    self.pages = {}
+    # Pages still shared with `self.base_snapshot`, and pages written since.
+    self.base_snapshot = None
+    self.shared_pages = set()
+    self.dirty_pages = set()
+
+  def __len__(self):
+    return self.size
+
+  def allocated_bytes(self):
+    return len(self.pages) * self.page_size
+
+  def _check_range(self, offset, length):
+    if offset < 0 or length < 0 or offset + length > self.size:
+      raise IndexError(
+          f"Range [0x{offset:x}, 0x{offset + length:x}) outside of memory of "
+          f"size 0x{self.size:x}")
+
+  def _page(self, index):
+    """Returns page `index` for writing.
+
+    Allocates the page from the fill pattern if needed, and copies it first if
+    it is still shared with a snapshot.
+    """
+    page = self.pages.get(index)
+    if page is None:
+      page = self.fill_page.copy()
+      self.pages[index] = page
+    elif index in self.shared_pages:
+      page = page.copy()
+      self.pages[index] = page
+      self.shared_pages.discard(index)
+    self.dirty_pages.add(index)
+    return page
+
+  def snapshot(self):
+    """Returns a copy-on-write snapshot of the current contents."""
+    snap = PagedMemorySnapshot(dict(self.pages))
+    self.base_snapshot = snap
+    self.shared_pages = set(self.pages)
+    self.dirty_pages = set()
+    return snap
+
+  def restore(self, snap):
+    """Restores the contents captured by `snapshot()`.
+
+    Restoring the most recent snapshot only touches pages written since it
+    was taken. Older snapshots restore every page.
+    """
+    if snap is self.base_snapshot:
+      touched = self.dirty_pages
+    else:
+      touched = set(self.pages) | set(snap.pages)
+    for index in touched:
+      page = snap.pages.get(index)
+      if page is None:
+        self.pages.pop(index, None)
+      else:
+        self.pages[index] = page
+    self.base_snapshot = snap
+    self.shared_pages = set(snap.pages)
+    self.dirty_pages = set()
+    return len(touched)
+
+  def _chunks(self, offset, length):
+    """Yields (page index, page offset, buffer offset, length) for a range."""
+    pos = offset
+    end = offset + length
+    while pos < end:
+      page_offset = pos & self.page_mask
+      chunk = min(self.page_size - page_offset, end - pos)
+      yield pos >> self.page_shift, page_offset, pos - offset, chunk
+      pos += chunk
+
+  def read(self, offset, length):
+    """Returns `length` bytes starting at `offset`.
+
+    Ranges within a single page are returned as a read-only view of that page.
+    """
+    self._check_range(offset, length)
+    chunks = list(self._chunks(offset, length))
+    if len(chunks) == 1:
+      index, page_offset, _, chunk = chunks[0]
+      page = self.pages.get(index, self.fill_page)
+      view = page[page_offset:page_offset + chunk]
+      view.flags.writeable = False
+      return view
+    out = np.empty([length], dtype=np.uint8)
+    for index, page_offset, buf_offset, chunk in chunks:
+      page = self.pages.get(index, self.fill_page)
+      out[buf_offset:buf_offset + chunk] = page[page_offset:page_offset + chunk]
+    return out
+
+  def write(self, offset, data, mask=None):
+    """Writes `data` at `offset`, skipping bytes where `mask` is False."""
+    data = _as_bytes(data)
+    self._check_range(offset, len(data))
+    if mask is not None:
+      mask = np.asarray(mask, dtype=bool).reshape(-1)
+    for index, page_offset, buf_offset, chunk in self._chunks(offset,
+                                                              len(data)):
+      src = data[buf_offset:buf_offset + chunk]
+      if mask is None:
+        self._page(index)[page_offset:page_offset + chunk] = src
+        continue
+      where = mask[buf_offset:buf_offset + chunk]
+      if where.any():
+        np.copyto(self._page(index)[page_offset:page_offset + chunk], src,
+                  where=where)
+
+  def gather(self, indices):
+    """Returns the bytes at an array of offsets, preserving its shape."""
+    indices = np.asarray(indices, dtype=np.int64)
+    if indices.size and (indices.min() < 0 or indices.max() >= self.size):
+      raise IndexError("Index outside of memory")
+    out = np.empty(indices.shape, dtype=np.uint8)
+    page_indices = indices >> self.page_shift
+    for index in np.unique(page_indices):
+      sel = page_indices == index
+      page = self.pages.get(int(index), self.fill_page)
+      out[sel] = page[indices[sel] & self.page_mask]
+    return out
+
+  def scatter(self, indices, values):
+    """Writes `values` to an array of offsets."""
+    indices = np.asarray(indices, dtype=np.int64)
+    values = np.broadcast_to(np.asarray(values, dtype=np.uint8), indices.shape)
+    if indices.size and (indices.min() < 0 or indices.max() >= self.size):
+      raise IndexError("Index outside of memory")
+    page_indices = indices >> self.page_shift
+    for index in np.unique(page_indices):
+      sel = page_indices == index
+      self._page(int(index))[indices[sel] & self.page_mask] = values[sel]
+
+  def _slice_range(self, key):
+    start, stop, step = key.indices(self.size)
+    if step != 1:
+      raise IndexError("PagedMemory only supports contiguous slices")
+    return start, max(stop - start, 0)
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      return self.read(*self._slice_range(key))
+    if isinstance(key, (int, np.integer)):
+      return self.read(int(key), 1)[0]
+    return self.gather(key)
+
+  def __setitem__(self, key, value):
+    if isinstance(key, slice):
+      offset, length = self._slice_range(key)
+      if np.isscalar(value):
+        value = np.full([length], value, dtype=np.uint8)
+      value = _as_bytes(value)
+      assert len(value) == length, "Size mismatch in PagedMemory assignment"
+      self.write(offset, value)
+    elif isinstance(key, (int, np.integer)):
+      self.write(int(key), np.array([value], dtype=np.uint8))
+    else:
+      self.scatter(key, value)
+
+
+class PagedMemorySnapshot:
+  """The pages of a PagedMemory at the time `snapshot()` was called."""
+
+  def __init__(self, pages):
+    self.pages = pages
+
+
+def _as_bytes(data):
+  """Returns `data` as a flat uint8 array, reinterpreting numpy buffers."""
+  if isinstance(data, np.ndarray):
+    return np.ascontiguousarray(data).view(np.uint8).reshape(-1)
+  return np.asarray(data, dtype=np.uint8).reshape(-1)
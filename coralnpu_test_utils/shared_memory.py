@@ -0,0 +1,203 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import os
+
+import numpy as np
+
+from multiprocessing import resource_tracker, shared_memory
+
+
+# The mapping starts with a header of HEADER_WORDS uint64 words:
+# magic, version, base address and size of the memory that follows.
+HEADER_MAGIC = int.from_bytes(b"CNPUMEM\0", "little")
+HEADER_VERSION = 1
+HEADER_WORDS = 8
+HEADER_BYTES = HEADER_WORDS * 8
+
+
+class _Mapping:
+  """A named shared memory segment or mmap'd file holding a header and data."""
+
+  def __init__(self, total_size, name=None, path=None, create=True):
+    assert (name is None) != (path is None), "Set exactly one of name and path"
+    self.shm = None
+    self.mmap = None
+    if name is not None:
+      if create:
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=total_size)
+      else:
+        try:
+          # Don't let this process' resource tracker unlink the segment.
+          self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+          # Before Python 3.13, unregister after attaching instead.
+          self.shm = shared_memory.SharedMemory(name=name)
+          resource_tracker.unregister(self.shm._name, "shared_memory")
+      self.buf = self.shm.buf
+    else:
+      mode = "w+b" if create else "r+b"
+      with open(path, mode) as f:
+        if create:
+          # Extend the file sparsely, only touched pages use disk space.
+          f.truncate(total_size)
+        self.mmap = mmap.mmap(f.fileno(), 0)
+      self.buf = memoryview(self.mmap)
+    self.name = name
+    self.path = path
+
+  def close(self):
+    self.buf.release()
+    if self.shm is not None:
+      self.shm.close()
+    else:
+      self.mmap.close()
+
+  def unlink(self):
+    if self.shm is not None:
+      self.shm.unlink()
+    else:
+      os.remove(self.path)
+
+
+class MappedMemory:
+  """Dense simulation memory in a shared memory segment or mmap'd file.
+
+  A drop-in replacement for PagedMemory, for when other processes need to
+  read or preload memory while the simulation runs. Create it with either
+  the `name` of a multiprocessing.shared_memory segment or a file `path`,
+  then attach from other processes with `attach_memory`.
+
+  `snapshot()` copies the whole memory, unlike PagedMemory's copy-on-write.
+  """
+
+  def __init__(self, size, base_addr=0, name=None, path=None, fill=0):
+    self.size = size
+    self.base_addr = base_addr
+    self.mapping = _Mapping(HEADER_BYTES + size, name=name, path=path)
+    header = np.ndarray([HEADER_WORDS], dtype=np.uint64,
+                        buffer=self.mapping.buf)
+    header[:4] = [HEADER_MAGIC, HEADER_VERSION, base_addr, size]
+    self.array = np.ndarray([size], dtype=np.uint8, buffer=self.mapping.buf,
+                            offset=HEADER_BYTES)
+    if isinstance(fill, int):
+      fill = bytes([fill])
+    if any(fill):
+      self.array[:] = np.resize(np.frombuffer(bytes(fill), dtype=np.uint8),
+                                size)
+
+  def __len__(self):
+    return self.size
+
+  def allocated_bytes(self):
+    return self.size
+
+  def _check_range(self, offset, length):
+    if offset < 0 or length < 0 or offset + length > self.size:
+      raise IndexError(
+          f"Range [0x{offset:x}, 0x{offset + length:x}) outside of memory of "
+          f"size 0x{self.size:x}")
+
+  def read(self, offset, length):
+    """Returns a read-only view of `length` bytes starting at `offset`."""
+    self._check_range(offset, length)
+    view = self.array[offset:offset + length]
+    view.flags.writeable = False
+    return view
+
+  def write(self, offset, data, mask=None):
+    """Writes `data` at `offset`, skipping bytes where `mask` is False."""
+    data = np.ascontiguousarray(data).view(np.uint8).reshape(-1)
+    self._check_range(offset, len(data))
+    dst = self.array[offset:offset + len(data)]
+    if mask is None:
+      dst[:] = data
+    else:
+      np.copyto(dst, data, where=np.asarray(mask, dtype=bool).reshape(-1))
+
+  def gather(self, indices):
+    return self.array[np.asarray(indices, dtype=np.int64)]
+
+  def scatter(self, indices, values):
+    self.array[np.asarray(indices, dtype=np.int64)] = values
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      start, stop, _ = key.indices(self.size)
+      return self.read(start, max(stop - start, 0))
+    return self.array[key]
+
+  def __setitem__(self, key, value):
+    self.array[key] = value
+
+  def snapshot(self):
+    return self.array.copy()
+
+  def restore(self, snap):
+    np.copyto(self.array, snap)
+    return self.size
+
+  def close(self):
+    # Views must not outlive the mapping.
+    del self.array
+    self.mapping.close()
+
+  def unlink(self):
+    """Removes the segment or file, once all processes closed it."""
+    self.mapping.unlink()
+
+
+class MemoryClient:
+  """A view of a MappedMemory from another process, addressed by bus address.
+
+  Reads and writes go straight to the shared pages without involving the
+  simulation, so they race with the core like any other agent would.
+  """
+
+  def __init__(self, name=None, path=None):
+    self.mapping = _Mapping(0, name=name, path=path, create=False)
+    header = np.ndarray([HEADER_WORDS], dtype=np.uint64,
+                        buffer=self.mapping.buf)
+    assert header[0] == HEADER_MAGIC and header[1] == HEADER_VERSION, \
+        "Not a simulation memory"
+    self.base_addr = int(header[2])
+    self.size = int(header[3])
+    self.array = np.ndarray([self.size], dtype=np.uint8,
+                            buffer=self.mapping.buf, offset=HEADER_BYTES)
+
+  def view(self, addr, size, dtype=np.uint8):
+    """Returns a writable numpy view of [addr, addr + size) as `dtype`."""
+    offset = addr - self.base_addr
+    if offset < 0 or offset + size > self.size:
+      raise IndexError(f"Range [0x{addr:x}, 0x{addr + size:x}) outside of "
+                       f"memory at 0x{self.base_addr:x}")
+    return self.array[offset:offset + size].view(dtype)
+
+  def read(self, addr, size):
+    return self.view(addr, size).copy()
+
+  def write(self, addr, data):
+    data = np.ascontiguousarray(data).view(np.uint8).reshape(-1)
+    self.view(addr, len(data))[:] = data
+
+  def close(self):
+    del self.array
+    self.mapping.close()
+
+
+def attach_memory(name=None, path=None):
+  """Attaches to a MappedMemory by shared memory name or file path."""
+  return MemoryClient(name=name, path=path)
@@ -13,8 +13,21 @@
 # limitations under the License.
 
 import cocotb
+import contextlib
+import numpy as np
 
-from coralnpu_test_utils.core_mini_axi_interface import CoreMiniAxiInterface
+from coralnpu_test_utils.core_mini_axi_interface import CoreMiniAxiInterface, TCM_REGIONS_HIGHMEM
+
+
+class FixtureSnapshot:
+    """Memory image captured by `Fixture.snapshot()`."""
+
+    def __init__(self, entry_point, symbols, memory, tcm):
+        self.entry_point = entry_point
+        self.symbols = symbols
+        self.memory = memory
+        # List of (address, data) for the TCM ranges loaded from the ELF.
+        self.tcm = tcm
 
 
 class Fixture:
@@ -26,8 +39,11 @@ class Fixture:
 
     @classmethod
     async def Create(cls, dut, **kwargs):
-        if kwargs.get("highmem"):
-            inst = cls(dut, csr_base_addr=0x200000)
+        if kwargs.pop("highmem", False):
+            inst = cls(dut,
+                       csr_base_addr=0x200000,
+                       tcm_regions=TCM_REGIONS_HIGHMEM,
+                       **kwargs)
         else:
             inst = cls(dut, **kwargs)
         await inst.core_mini_axi.init()
@@ -48,32 +64,87 @@ class Fixture:
                 for s in symbols
             }
 
+    async def snapshot(self) -> FixtureSnapshot:
+        """Captures external memory and the loaded TCM image.
+
+        External memory is captured copy-on-write, so this is cheap to call
+        after every `load_elf_and_lookup_symbols`.
+        """
+        tcm = []
+        for addr, size in self.core_mini_axi.loaded_segments:
+            tcm.append(
+                (addr, await self.core_mini_axi.read_backdoor(addr, size)))
+        return FixtureSnapshot(self.entry_point,
+                               dict(self.symbols),
+                               self.core_mini_axi.memory.snapshot(),
+                               tcm)
+
+    async def restore(self, snap: FixtureSnapshot):
+        """Resets the core and restores the memory image from `snap`.
+
+        Only external memory pages written since the snapshot are restored.
+        TCM ranges are rewritten from the captured image, which skips the ELF
+        parsing and symbol lookups of a full reload, through the TCM backdoor
+        when the simulator exposes it.
+        """
+        await self.core_mini_axi.reset()
+        self.core_mini_axi.discard_writes()
+        self.core_mini_axi.memory.restore(snap.memory)
+        for addr, data in snap.tcm:
+            await self.core_mini_axi.write_backdoor(addr, data)
+        self.entry_point = snap.entry_point
+        self.symbols = dict(snap.symbols)
+
+    # With `write_combining=True` passed to Create, symbol writes are buffered
+    # and combined until the core runs or an overlapping access.
     async def write(self, symbol: str, data):
-        await self.core_mini_axi.write(self.symbols[symbol], data)
+        await self.core_mini_axi.write_buffered(self.symbols[symbol], data)
 
     async def write_word(self, symbol: str, data):
-        await self.core_mini_axi.write_word(self.symbols[symbol], data)
+        await self.core_mini_axi.write_buffered(
+            self.symbols[symbol], np.array([data], dtype=np.uint32))
 
     async def write_ptr(
             self, addr_symbol: str, data_symbol: str, offset: int = 0):
-        await self.core_mini_axi.write_word(
-            self.symbols[addr_symbol], self.symbols[data_symbol] + offset)
+        await self.core_mini_axi.write_buffered(
+            self.symbols[addr_symbol],
+            np.array([self.symbols[data_symbol] + offset], dtype=np.uint32))
 
     async def read(self, symbol: str, size: int):
         return await self.core_mini_axi.read(self.symbols[symbol], size)
 
+    async def read_array(self, symbol: str, dtype, shape):
+        """Reads `symbol` as an array of `dtype` and `shape`.
+
+        See CoreMiniAxiInterface.read_array, which may return a read-only view.
+        """
+        return await self.core_mini_axi.read_array(self.symbols[symbol], dtype,
+                                                   shape)
+
     async def read_word(self, symbol: str):
         return await self.core_mini_axi.read_word(self.symbols[symbol])
 
-    async def run_to_halt(self, timeout_cycles=10000):
+    async def run_to_halt(self, timeout_cycles=10000, fast_forward=False):
+        """Runs from the entry point until the core halts.
+
+        With `fast_forward`, the slave port agents are parked while waiting,
+        see CoreMiniAxiInterface.fast_forward.
+        """
         await self.core_mini_axi.execute_from(self.entry_point)
-        return await self.core_mini_axi.wait_for_halted(
-            timeout_cycles=timeout_cycles)
+        async with self._fast_forward(fast_forward):
+            return await self.core_mini_axi.wait_for_halted(
+                timeout_cycles=timeout_cycles)
 
-    async def run_to_fault(self, timeout_cycles=10000):
+    async def run_to_fault(self, timeout_cycles=10000, fast_forward=False):
         await self.core_mini_axi.execute_from(self.entry_point)
-        return await self.core_mini_axi.wait_for_fault(
-            timeout_cycles=timeout_cycles)
+        async with self._fast_forward(fast_forward):
+            return await self.core_mini_axi.wait_for_fault(
+                timeout_cycles=timeout_cycles)
+
+    def _fast_forward(self, enabled):
+        if enabled:
+            return self.core_mini_axi.fast_forward()
+        return contextlib.nullcontext()
 
     def fault(self):
         return self.core_mini_axi.dut.io_fault.value == 1
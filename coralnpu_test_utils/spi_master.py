@@ -13,20 +13,31 @@
 # limitations under the License.
 
 import cocotb
+import numpy as np
 from cocotb.clock import Clock
-from cocotb.triggers import ClockCycles, FallingEdge
+from cocotb.triggers import ClockCycles, FallingEdge, RisingEdge
+from cocotb.utils import get_sim_time
 from coralnpu_test_utils.spi_constants import SpiRegAddress, SpiCommand, TlStatus, CMD_WRITE
 
 
 class SPIMaster:
-    def __init__(self, clk, csb, mosi, miso, main_clk, log):
+    # Fastest SPI clock, as a multiple of the main clock frequency. Bytes from
+    # the SPI domain cross through a 2-deep AsyncQueue without backpressure,
+    # which drains a byte every ~4 main clocks while a byte arrives every 8
+    # SPI clocks.
+    MAX_CLOCK_RATIO = 2
+
+    def __init__(self, clk, csb, mosi, miso, main_clk, log, max_clock_ratio=False):
         self.clk = clk
         self.csb = csb
         self.mosi = mosi
         self.miso = miso
         self.main_clk = main_clk
         self.log = log
-        self.spi_clk_driver = Clock(self.clk, 10)
+        # With `max_clock_ratio`, the SPI clock period is derived from the
+        # main clock on the first start_clock.
+        self.max_clock_ratio = max_clock_ratio
+        self.spi_clk_driver = None if max_clock_ratio else Clock(self.clk, 10)
         self.clock_task = None
 
         # Initialize signal values
@@ -34,7 +45,21 @@ class SPIMaster:
         self.csb.value = 1
         self.mosi.value = 0
 
+    async def _main_clk_period(self):
+        """Measures the main clock period in simulator steps."""
+        await RisingEdge(self.main_clk)
+        start = get_sim_time(unit="step")
+        await RisingEdge(self.main_clk)
+        return get_sim_time(unit="step") - start
+
     async def start_clock(self):
+        if self.spi_clk_driver is None:
+            main_period = await self._main_clk_period()
+            # Round up, so the SPI clock never exceeds MAX_CLOCK_RATIO. An odd
+            # period gets a shorter high phase rather than being rounded.
+            period = max(-(-main_period // self.MAX_CLOCK_RATIO), 2)
+            assert main_period / period <= self.MAX_CLOCK_RATIO
+            self.spi_clk_driver = Clock(self.clk, period, period_high=period // 2)
         if self.clock_task is None:
             self.clock_task = cocotb.start_soon(self.spi_clk_driver.start())
 
@@ -47,13 +72,28 @@ class SPIMaster:
     async def _set_cs(self, active):
         self.csb.value = not active
 
+    async def _clock_bytes(self, data_out, capture=False):
+        """Clocks out `data_out` MSB first, with one await per SPI clock.
+
+        MOSI is driven from a precomputed bit list. If `capture` is set, MISO
+        is sampled on each falling edge and returned as a bytearray.
+        """
+        bits = np.unpackbits(np.frombuffer(bytes(data_out), dtype=np.uint8)).tolist()
+        bits_in = bytearray(len(bits)) if capture else None
+        mosi = self.mosi
+        miso = self.miso
+        falling = FallingEdge(self.clk)
+        for i, bit in enumerate(bits):
+            mosi.value = bit
+            await falling
+            if capture:
+                bits_in[i] = int(miso.value)
+        if capture:
+            return bytearray(np.packbits(np.frombuffer(bits_in, dtype=np.uint8)))
+        return None
+
     async def _clock_byte(self, data_out):
-        data_in = 0
-        for i in range(8):
-            self.mosi.value = (data_out >> (7-i)) & 1
-            await FallingEdge(self.clk)
-            data_in = (data_in << 1) | int(self.miso.value)
-        return data_in
+        return (await self._clock_bytes([data_out], capture=True))[0]
 
     async def idle_clocking(self, cycles):
         await self.start_clock()
@@ -105,8 +145,7 @@ class SPIMaster:
         await self._set_cs(True)
         await ClockCycles(self.main_clk, 1)
         await self.start_clock()
-        await self._clock_byte(reg_addr)
-        read_data = await self._clock_byte(0x00)
+        read_data = (await self._clock_bytes([reg_addr, 0x00], capture=True))[1]
         await self.stop_clock()
         await ClockCycles(self.main_clk, 1)
         await self._set_cs(False)
@@ -152,40 +191,25 @@ class SPIMaster:
         await self.start_clock()
 
         # Write addr
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_ADDR_REG_0)
-        await self._clock_byte((target_addr >> 0) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_ADDR_REG_1)
-        await self._clock_byte((target_addr >> 8) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_ADDR_REG_2)
-        await self._clock_byte((target_addr >> 16) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_ADDR_REG_3)
-        await self._clock_byte((target_addr >> 24) & 0xFF)
+        stream = bytearray()
+        for i in range(4):
+            stream += bytes([CMD_WRITE | (SpiRegAddress.TL_ADDR_REG_0 + i),
+                             (target_addr >> (i * 8)) & 0xFF])
 
         # Write beats
         num_beats = len(data)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_LEN_REG_L)
-        await self._clock_byte((num_beats - 1) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_LEN_REG_H)
-        await self._clock_byte(((num_beats - 1) >> 8) & 0xFF)
+        stream += bytes([CMD_WRITE | SpiRegAddress.TL_LEN_REG_L, (num_beats - 1) & 0xFF,
+                         CMD_WRITE | SpiRegAddress.TL_LEN_REG_H, ((num_beats - 1) >> 8) & 0xFF])
 
-        # Write data using bulk transfer
-        all_data_bytes = []
+        # Command for bulk write, then the data stream
+        num_bytes = num_beats * 16
+        stream += bytes([CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_L, (num_bytes - 1) & 0xFF,
+                         CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_H, ((num_bytes - 1) >> 8) & 0xFF])
         for beat in data:
-            for i in range(16):
-                all_data_bytes.append((beat >> (i * 8)) & 0xFF)
-
-        # Command for bulk write
-        num_bytes = len(all_data_bytes)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_L)
-        await self._clock_byte((num_bytes - 1) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_H)
-        await self._clock_byte(((num_bytes - 1) >> 8) & 0xFF)
-        # Data stream
-        for byte in all_data_bytes:
-            await self._clock_byte(byte)
-
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.TL_CMD_REG)
-        await self._clock_byte(SpiCommand.CMD_WRITE_START)
+            stream += beat.to_bytes(16, byteorder='little')
+
+        stream += bytes([CMD_WRITE | SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_WRITE_START])
+        await self._clock_bytes(stream)
 
         await self.stop_clock()
         await ClockCycles(self.main_clk, 1)
@@ -198,16 +222,12 @@ class SPIMaster:
 
         await self.start_clock()
 
-        # Command and Length for bulk write (L, H)
+        # Command and Length for bulk write (L, H), then the data stream
         num_bytes = len(data)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_L)
-        await self._clock_byte((num_bytes - 1) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_H)
-        await self._clock_byte(((num_bytes - 1) >> 8) & 0xFF)
-
-        # Data stream
-        for byte in data:
-            await self._clock_byte(byte)
+        stream = bytearray([CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_L, (num_bytes - 1) & 0xFF,
+                            CMD_WRITE | SpiRegAddress.BULK_WRITE_PORT_H, ((num_bytes - 1) >> 8) & 0xFF])
+        stream += bytes(data)
+        await self._clock_bytes(stream)
 
         await self.stop_clock()
         await ClockCycles(self.main_clk, 1)
@@ -221,19 +241,14 @@ class SPIMaster:
         await self.start_clock()
 
         # Command and Length to initiate a bulk read (L, H)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.BULK_READ_PORT_L)
-        await self._clock_byte((num_bytes - 1) & 0xFF)
-        await self._clock_byte(CMD_WRITE | SpiRegAddress.BULK_READ_PORT_H)
-        await self._clock_byte(((num_bytes - 1) >> 8) & 0xFF)
-
-        # The MISO pipeline has latency. The first dummy transfer flushes a junk byte.
-        await self._clock_byte(0x00)
-
-        # The subsequent transfers clock in the actual data.
-        received_bytes = []
-        for _ in range(num_bytes):
-            byte_in = await self._clock_byte(0x00)
-            received_bytes.append(byte_in)
+        header = bytes([CMD_WRITE | SpiRegAddress.BULK_READ_PORT_L, (num_bytes - 1) & 0xFF,
+                        CMD_WRITE | SpiRegAddress.BULK_READ_PORT_H, ((num_bytes - 1) >> 8) & 0xFF])
+
+        # The MISO pipeline has latency. The first dummy transfer flushes a junk
+        # byte, and the subsequent transfers clock in the actual data.
+        stream = header + bytes(1 + num_bytes)
+        received = await self._clock_bytes(stream, capture=True)
+        received_bytes = list(received[len(header) + 1:])
 
         await self.stop_clock()
         await ClockCycles(self.main_clk, 1)
@@ -15,6 +15,7 @@
 #include <arpa/inet.h>
 #include <netinet/in.h>
 #include <sys/socket.h>
+#include <sys/un.h>
 #include <unistd.h>
 
 #include <cstdint>
@@ -22,8 +23,10 @@
 #include <iostream>
 #include <mutex>
 #include <queue>
+#include <string>
 #include <thread>
 #include <atomic>
+#include <condition_variable>
 #include <vector>
 
 #include "svdpi.h"
@@ -40,6 +43,13 @@ enum class CommandType : uint8_t {
   READ_SPI_DOMAIN_REG = 5,
   WRITE_REG_16B = 6,
   READ_SPI_DOMAIN_REG_16B = 7,
+  // A frame of `count` commands, each a SpiCommand followed by its payload.
+  // The response is `count` SpiResponses followed by the data of any bulk
+  // reads, in order.
+  BATCH = 8,
+  // Only valid inside a BATCH: a POLL_REG which, if it fails, skips the rest
+  // of the batch. Skipped commands respond with success = 0.
+  POLL_REG_OR_ABORT = 9,
 };
 
 // The command structure sent from the Python client.
@@ -67,11 +77,15 @@ std::queue<QueuedSpiCommand> cmd_queue;
 std::mutex cmd_mutex;
 std::queue<SpiResponse> result_queue;
 std::mutex result_mutex;
+std::condition_variable result_cv;
 std::queue<std::vector<uint8_t>> bulk_read_queue;
 std::mutex bulk_read_mutex;
+std::condition_variable bulk_read_cv;
 
 // Global state for the server thread.
 int server_fd = -1;
+// If set, the server listens on this Unix domain socket instead of TCP.
+std::string server_socket_path;
 std::thread server_thread;
 std::atomic<bool> shutting_down{false};
 
@@ -179,39 +193,187 @@ struct SpiDpiFsmState {
 
 // static SpiDpiFsmState fsm_state;
 
-// The main loop for the server thread. It listens for a client connection,
-// reads commands, and pushes them to the thread-safe command queue.
-void server_loop(int port) {
-  struct sockaddr_in address;
-  int opt = 1;
-  socklen_t addrlen = sizeof(address);
+// Queues a response for the server thread.
+void push_result(SpiResponse response) {
+  {
+    std::lock_guard<std::mutex> lock(result_mutex);
+    result_queue.push(response);
+  }
+  result_cv.notify_one();
+}
 
-  if ((server_fd = socket(AF_INET, SOCK_STREAM, 0)) == 0) {
-    perror("socket failed");
-    return;
+// Blocks until the simulation thread produced the next response.
+SpiResponse wait_for_result() {
+  std::unique_lock<std::mutex> lock(result_mutex);
+  result_cv.wait(lock, [] { return !result_queue.empty(); });
+  SpiResponse response = result_queue.front();
+  result_queue.pop();
+  return response;
+}
+
+// Blocks until the simulation thread produced the next bulk read payload.
+std::vector<uint8_t> wait_for_bulk_read() {
+  std::unique_lock<std::mutex> lock(bulk_read_mutex);
+  bulk_read_cv.wait(lock, [] { return !bulk_read_queue.empty(); });
+  std::vector<uint8_t> payload = bulk_read_queue.front();
+  bulk_read_queue.pop();
+  return payload;
+}
+
+// Reads exactly `size` bytes, returning false if the client disconnected.
+bool read_exact(int fd, void* buf, size_t size) {
+  uint8_t* p = static_cast<uint8_t*>(buf);
+  while (size > 0) {
+    ssize_t n = read(fd, p, size);
+    if (n <= 0) {
+      return false;
+    }
+    p += n;
+    size -= n;
   }
+  return true;
+}
 
-  if (setsockopt(server_fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt))) {
-    perror("setsockopt");
-    return;
+// Reads a command header and its payload, if any.
+bool read_command(int fd, QueuedSpiCommand* q_cmd) {
+  if (!read_exact(fd, &q_cmd->header, sizeof(q_cmd->header))) {
+    return false;
+  }
+  q_cmd->payload.clear();
+  if (q_cmd->header.type == CommandType::PACKED_WRITE) {
+    size_t payload_size = q_cmd->header.count;
+    payload_size *= 16;
+    if (payload_size > 0) {
+      q_cmd->payload.resize(payload_size);
+      return read_exact(fd, q_cmd->payload.data(), payload_size);
+    }
   }
-  address.sin_family = AF_INET;
-  address.sin_addr.s_addr = INADDR_ANY;
-  address.sin_port = htons(port);
+  return true;
+}
 
-  if (bind(server_fd, (struct sockaddr*)&address, sizeof(address)) < 0) {
-    perror("bind failed");
-    return;
+void send_all(int fd, const void* buf, size_t size) {
+  const uint8_t* p = static_cast<const uint8_t*>(buf);
+  while (size > 0) {
+    ssize_t n = send(fd, p, size, 0);
+    if (n <= 0) {
+      return;
+    }
+    p += n;
+    size -= n;
+  }
+}
+
+// Runs the commands of a BATCH frame and sends back all of their responses.
+// Commands are handed to the simulation thread up to and including the next
+// POLL_REG_OR_ABORT, so the SPI bus is never left idle waiting on the socket.
+bool run_batch(int client_socket, uint32_t count) {
+  std::vector<QueuedSpiCommand> cmds(count);
+  for (auto& cmd : cmds) {
+    if (!read_command(client_socket, &cmd)) {
+      return false;
+    }
   }
-  if (listen(server_fd, 3) < 0) {
+
+  std::vector<SpiResponse> responses;
+  std::vector<uint8_t> bulk_payload;
+  size_t next = 0;
+  while (next < cmds.size()) {
+    size_t end = next;
+    bool conditional = false;
+    {
+      std::lock_guard<std::mutex> lock(cmd_mutex);
+      while (end < cmds.size() && !conditional) {
+        conditional = cmds[end].header.type == CommandType::POLL_REG_OR_ABORT;
+        if (conditional) {
+          cmds[end].header.type = CommandType::POLL_REG;
+        }
+        cmd_queue.push(cmds[end++]);
+      }
+    }
+    for (; next < end; next++) {
+      SpiResponse response = wait_for_result();
+      responses.push_back(response);
+      if (cmds[next].header.type == CommandType::BULK_READ && response.success) {
+        std::vector<uint8_t> payload = wait_for_bulk_read();
+        bulk_payload.insert(bulk_payload.end(), payload.begin(), payload.end());
+      }
+    }
+    if (conditional && responses.back().data != 1) {
+      break;
+    }
+  }
+  // Skipped commands.
+  responses.resize(cmds.size(), SpiResponse{0, 0});
+
+  send_all(client_socket, responses.data(), responses.size() * sizeof(SpiResponse));
+  if (!bulk_payload.empty()) {
+    send_all(client_socket, bulk_payload.data(), bulk_payload.size());
+  }
+  return true;
+}
+
+// Creates the listening socket: a Unix domain socket at `socket_path` if it
+// is set, otherwise TCP on `port`. Returns -1 on failure.
+int listen_socket(int port, const std::string& socket_path) {
+  int fd;
+  if (!socket_path.empty()) {
+    struct sockaddr_un address = {};
+    if (socket_path.size() >= sizeof(address.sun_path)) {
+      std::cerr << "DPI: Socket path too long: " << socket_path << std::endl;
+      return -1;
+    }
+    if ((fd = socket(AF_UNIX, SOCK_STREAM, 0)) < 0) {
+      perror("socket failed");
+      return -1;
+    }
+    address.sun_family = AF_UNIX;
+    socket_path.copy(address.sun_path, sizeof(address.sun_path) - 1);
+    unlink(socket_path.c_str());
+    if (bind(fd, (struct sockaddr*)&address, sizeof(address)) < 0) {
+      perror("bind failed");
+      return -1;
+    }
+  } else {
+    struct sockaddr_in address;
+    int opt = 1;
+    if ((fd = socket(AF_INET, SOCK_STREAM, 0)) < 0) {
+      perror("socket failed");
+      return -1;
+    }
+    if (setsockopt(fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt))) {
+      perror("setsockopt");
+      return -1;
+    }
+    address.sin_family = AF_INET;
+    address.sin_addr.s_addr = INADDR_ANY;
+    address.sin_port = htons(port);
+    if (bind(fd, (struct sockaddr*)&address, sizeof(address)) < 0) {
+      perror("bind failed");
+      return -1;
+    }
+  }
+  if (listen(fd, 3) < 0) {
     perror("listen");
+    return -1;
+  }
+  return fd;
+}
+
+// The main loop for the server thread. It listens for a client connection,
+// reads commands, and pushes them to the thread-safe command queue.
+void server_loop(int port) {
+  if ((server_fd = listen_socket(port, server_socket_path)) < 0) {
     return;
   }
 
-  std::cout << "DPI: Server listening on port " << port << std::endl;
+  if (!server_socket_path.empty()) {
+    std::cout << "DPI: Server listening on unix socket " << server_socket_path << std::endl;
+  } else {
+    std::cout << "DPI: Server listening on port " << port << std::endl;
+  }
 
   int client_socket;
-  if ((client_socket = accept(server_fd, (struct sockaddr*)&address, &addrlen)) < 0) {
+  if ((client_socket = accept(server_fd, nullptr, nullptr)) < 0) {
     if (!shutting_down) {
       perror("accept");
     }
@@ -219,23 +381,17 @@ void server_loop(int port) {
   }
 
   while (true) {
-    SpiCommand cmd_header;
-    int valread = read(client_socket, &cmd_header, sizeof(cmd_header));
-    if (valread <= 0) {
+    QueuedSpiCommand q_cmd;
+    if (!read_command(client_socket, &q_cmd)) {
       // Client disconnected or error.
       break;
     }
 
-    QueuedSpiCommand q_cmd;
-    q_cmd.header = cmd_header;
-
-    if (cmd_header.type == CommandType::PACKED_WRITE) {
-      size_t payload_size = cmd_header.count;
-      payload_size *= 16;
-      if (payload_size > 0) {
-        q_cmd.payload.resize(payload_size);
-        read(client_socket, q_cmd.payload.data(), payload_size);
+    if (q_cmd.header.type == CommandType::BATCH) {
+      if (!run_batch(client_socket, q_cmd.header.count)) {
+        break;
       }
+      continue;
     }
 
     {
@@ -244,31 +400,13 @@ void server_loop(int port) {
     }
 
     // All commands expect a response packet.
-    // Busy-wait for the result to become available from the simulation thread.
-    while (result_queue.empty()) {
-      std::this_thread::sleep_for(std::chrono::milliseconds(1));
-    }
-
-    SpiResponse response;
-    {
-      std::lock_guard<std::mutex> lock(result_mutex);
-      response = result_queue.front();
-      result_queue.pop();
-    }
-    send(client_socket, &response, sizeof(response), 0);
+    SpiResponse response = wait_for_result();
+    send_all(client_socket, &response, sizeof(response));
 
     // If it was a successful bulk read, also send the data payload.
-    if ((cmd_header.type == CommandType::BULK_READ) && response.success) {
-        while(bulk_read_queue.empty()) {
-            std::this_thread::sleep_for(std::chrono::milliseconds(1));
-        }
-        std::vector<uint8_t> read_payload;
-        {
-            std::lock_guard<std::mutex> lock(bulk_read_mutex);
-            read_payload = bulk_read_queue.front();
-            bulk_read_queue.pop();
-        }
-        send(client_socket, read_payload.data(), read_payload.size(), 0);
+    if ((q_cmd.header.type == CommandType::BULK_READ) && response.success) {
+      std::vector<uint8_t> read_payload = wait_for_bulk_read();
+      send_all(client_socket, read_payload.data(), read_payload.size());
     }
   }
   close(client_socket);
@@ -279,9 +417,12 @@ void server_loop(int port) {
 extern "C" {
 
 struct SpiDpiFsmState* spi_dpi_init() {
+  const char* socket_str = getenv("SPI_DPI_SOCKET");
   const char* port_str = getenv("SPI_DPI_PORT");
   int port = 5555; // Default port
-  if (port_str) {
+  if (socket_str) {
+    server_socket_path = socket_str;
+  } else if (port_str) {
     port = std::stoi(port_str);
   } else {
     std::cout << "SPI_DPI_PORT environment variable not set. Defaulting to " << port << std::endl;
@@ -301,6 +442,9 @@ void spi_dpi_close(struct SpiDpiFsmState* ctx) {
   if (server_thread.joinable()) {
     server_thread.join();
   }
+  if (!server_socket_path.empty()) {
+    unlink(server_socket_path.c_str());
+  }
   if (ctx) {
     delete ctx;
   }
@@ -411,8 +555,7 @@ void handle_write_reg(unsigned char miso, struct SpiDpiFsmState* ctx) {
       ctx->signal_state.mosi = 0;
       ctx->state = IDLE;
       {
-        std::lock_guard<std::mutex> lock(result_mutex);
-        result_queue.push({0, 1}); // Success, no data to return
+        push_result({0, 1}); // Success, no data to return
       }
       break;
 
@@ -492,8 +635,7 @@ void handle_write_reg_16b(unsigned char miso, struct SpiDpiFsmState* ctx) {
       ctx->signal_state.mosi = 0;
       ctx->state = IDLE;
       {
-        std::lock_guard<std::mutex> lock(result_mutex);
-        result_queue.push({0, 1});  // Success
+        push_result({0, 1});  // Success
       }
       break;
     default:
@@ -514,15 +656,13 @@ void handle_poll_reg(unsigned char miso, struct SpiDpiFsmState* ctx) {
         // Success!
         ctx->state = IDLE;
         {
-          std::lock_guard<std::mutex> lock(result_mutex);
-          result_queue.push({1, 1}); // Return success
+          push_result({1, 1}); // Return success
         }
       } else if (--ctx->poll_count <= 0) {
         // Timeout
         ctx->state = IDLE;
         {
-          std::lock_guard<std::mutex> lock(result_mutex);
-          result_queue.push({0, 1}); // Return failure
+          push_result({0, 1}); // Return failure
         }
       } else {
         // Not the value we want, try another read.
@@ -584,8 +724,7 @@ void handle_idle_clocking(unsigned char miso, struct SpiDpiFsmState* ctx) {
     ctx->signal_state.sck = 0; // Ensure clock is left low
     ctx->state = IDLE;
     {
-      std::lock_guard<std::mutex> lock(result_mutex);
-      result_queue.push({0, 1});
+      push_result({0, 1});
     }
   }
 }
@@ -705,8 +844,7 @@ void handle_packed_write(unsigned char miso, struct SpiDpiFsmState* ctx) {
       ctx->signal_state.mosi = 0;
       ctx->state = IDLE;
       {
-        std::lock_guard<std::mutex> lock(result_mutex);
-        result_queue.push({0, 1});  // Success
+        push_result({0, 1});  // Success
       }
       break;
     default:
@@ -827,13 +965,13 @@ void handle_bulk_read(unsigned char miso, struct SpiDpiFsmState* ctx) {
       ctx->signal_state.csb = 1;
       ctx->state = IDLE;
       {
-        std::lock_guard<std::mutex> lock(result_mutex);
-        result_queue.push({0, 1}); // Success, data is sent separately
+        push_result({0, 1}); // Success, data is sent separately
       }
       {
         std::lock_guard<std::mutex> lock(bulk_read_mutex);
         bulk_read_queue.push(ctx->bulk_data_buffer);
       }
+      bulk_read_cv.notify_one();
       break;
 
     default:
@@ -889,8 +1027,7 @@ void handle_read_spi_domain_reg(unsigned char miso, struct SpiDpiFsmState* ctx)
       ctx->signal_state.mosi = 0;
       ctx->state = IDLE;
       {
-        std::lock_guard<std::mutex> lock(result_mutex);
-        result_queue.push({(uint64_t)ctx->data_in, 1});
+        push_result({(uint64_t)ctx->data_in, 1});
       }
       break;
 
@@ -957,8 +1094,7 @@ void handle_read_spi_domain_reg_16b(unsigned char miso, struct SpiDpiFsmState* c
       ctx->signal_state.mosi = 0;
       ctx->state = IDLE;
       {
-        std::lock_guard<std::mutex> lock(result_mutex);
-        result_queue.push({(uint64_t)ctx->read_16b_data, 1});
+        push_result({(uint64_t)ctx->read_16b_data, 1});
       }
       break;
     default:
@@ -1002,8 +1138,7 @@ void spi_dpi_tick(struct SpiDpiFsmState* ctx, unsigned char* sck, unsigned char*
             ctx->cycle_wait_count = ctx->current_cmd.header.count * 2;
           } else {
             // If 0 cycles, just send ack immediately.
-            std::lock_guard<std::mutex> lock(result_mutex);
-            result_queue.push({0, 1});
+            push_result({0, 1});
           }
           break;
         case CommandType::PACKED_WRITE:
@@ -1025,8 +1160,7 @@ void spi_dpi_tick(struct SpiDpiFsmState* ctx, unsigned char* sck, unsigned char*
         default:
           // For now, just acknowledge other commands immediately.
           {
-            std::lock_guard<std::mutex> lock(result_mutex);
-            result_queue.push({0, 1});
+            push_result({0, 1});
           }
           ctx->state = IDLE;
           break;
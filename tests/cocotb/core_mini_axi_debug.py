@@ -460,4 +460,44 @@ async def core_mini_axi_debug_scalar_registers(dut):
         # NB: We don't raise_irq here, because the debug halt resolves WFI.
 
         await core_mini_axi.wait_for_halted()
-        assert core_mini_axi.dut.io_fault.value == 0
\ No newline at end of file
+        assert core_mini_axi.dut.io_fault.value == 0
+
+@cocotb.test()
+async def core_mini_axi_debug_batch_registers(dut):
+    core_mini_axi = CoreMiniAxiInterface(dut)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+    r = runfiles.Create()
+    with open(r.Rlocation("coralnpu_hw/tests/cocotb/registers.elf"), "rb") as f:
+        entry_point = await core_mini_axi.load_elf(f)
+        await core_mini_axi.execute_from(entry_point)
+        await core_mini_axi.wait_for_wfi()
+
+        await core_mini_axi.dm_request_halt()
+        await core_mini_axi.dm_wait_for_halted()
+
+        # The batched snapshot must match single register reads.
+        snapshot = await core_mini_axi.dm_snapshot_hart(include_float=True)
+        for i in range(1,32):
+            assert (snapshot["x"][i] == (1 << i))
+            assert (snapshot["x"][i] == await core_mini_axi.dm_read_reg(i + 0x1000))
+        for i in range(32):
+            assert (snapshot["f"][i] == await core_mini_axi.dm_read_reg(i + 0x1020))
+        assert (snapshot["dpc"] == await core_mini_axi.dm_read_reg(0x7B1))
+        assert (snapshot["dcsr"] == await core_mini_axi.dm_read_reg(0x7B0))
+
+        # Batched writes must be visible to single register reads.
+        await core_mini_axi.dm_write_regs({
+            0x101e: 0xdeadbeef,
+            0x101f: 0xdeadbeef,
+        })
+        assert (await core_mini_axi.dm_read_reg(0x101e) == 0xdeadbeef)
+        assert (await core_mini_axi.dm_read_reg(0x101f) == 0xdeadbeef)
+        assert (await core_mini_axi.dm_read_regs([0x101e, 0x101f]) ==
+                [0xdeadbeef, 0xdeadbeef])
+
+        # x30 == x31 makes the test case exit successfully.
+        await core_mini_axi.dm_request_resume()
+        await core_mini_axi.wait_for_halted()
+        assert core_mini_axi.dut.io_fault.value == 0
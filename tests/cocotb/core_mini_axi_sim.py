@@ -19,7 +19,14 @@ import os
 import tqdm
 import random
 
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+from coralnpu_test_utils.axi_recorder import AxiChannel, AxiPort, AxiRecorder, AxiReplay, load_recording
+from coralnpu_test_utils.axi_slave import AxiSlave
 from coralnpu_test_utils.core_mini_axi_interface import AxiBurst, AxiResp,CoreMiniAxiInterface
+from coralnpu_test_utils.memory_timing import MemoryTiming
+from coralnpu_test_utils.shared_memory import attach_memory
+from coralnpu_test_utils.sim_test_fixture import Fixture
 from bazel_tools.tools.python.runfiles import runfiles
 
 
@@ -367,3 +374,354 @@ async def core_mini_axi_float_csr_test(dut):
 
     await core_mini_axi.wait_for_halted()
     assert core_mini_axi.dut.io_fault.value == 0
+
+@cocotb.test()
+async def core_mini_axi_backdoor_test(dut):
+    """Checks that TCM backdoor accesses agree with the AXI slave port."""
+    core_mini_axi = CoreMiniAxiInterface(dut)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    for base, size in [(0x0, 0x2000), (0x10000, 0x8000)]:
+      for _ in range(20):
+        addr = random.randint(base, base + size - 2)
+        length = random.randint(1, base + size - addr)
+        wdata = np.random.randint(0, 255, length, dtype=np.uint8)
+        await core_mini_axi.write_backdoor(addr, wdata)
+        rdata = await core_mini_axi.read(addr, length)
+        assert (wdata == rdata).all()
+
+        wdata = np.random.randint(0, 255, length, dtype=np.uint8)
+        await core_mini_axi.write(addr, wdata)
+        rdata = await core_mini_axi.read_backdoor(addr, length)
+        assert (wdata == rdata).all()
+
+@cocotb.test()
+async def core_mini_axi_outstanding_test(dut):
+    """Checks write/read with multiple outstanding slave port transactions."""
+    core_mini_axi = CoreMiniAxiInterface(dut)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    for max_outstanding in [2, 4, 8]:
+      for _ in range(10):
+        addr = random.randint(0x10000, 0x17FFF)
+        length = random.randint(1, 0x18000 - addr)
+        wdata = np.random.randint(0, 255, length, dtype=np.uint8)
+        await core_mini_axi.write(addr, wdata, max_outstanding=max_outstanding)
+        rdata = await core_mini_axi.read(addr, length)
+        assert (wdata == rdata).all()
+        rdata = await core_mini_axi.read(addr, length,
+                                         max_outstanding=max_outstanding)
+        assert (wdata == rdata).all()
+
+@cocotb.test()
+async def core_mini_axi_stats_test(dut):
+    """Checks that AXI statistics count slave port handshakes."""
+    core_mini_axi = CoreMiniAxiInterface(dut, axi_stats=True)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    wdata = np.random.randint(0, 255, 256, dtype=np.uint8)
+    await core_mini_axi.write(0x10000, wdata)
+    rdata = await core_mini_axi.read(0x10000, 256)
+    assert (wdata == rdata).all()
+
+    stats = core_mini_axi.stats.to_dict()["ports"]["slave"]
+    assert stats["handshakes"]["aw"] == 1
+    assert stats["handshakes"]["w"] == 16
+    assert stats["handshakes"]["b"] == 1
+    assert stats["handshakes"]["ar"] == 1
+    assert stats["handshakes"]["r"] == 16
+    assert stats["write_bytes"] == 256
+    assert stats["read_bytes"] == 256
+    assert stats["latency"]["ar_to_first_r"]["summary"]["min"] > 0
+
+@cocotb.test()
+async def core_mini_axi_record_replay_test(dut):
+    """Records slave port traffic, then replays it and compares responses."""
+    recorder = AxiRecorder()
+    core_mini_axi = CoreMiniAxiInterface(dut, recorder=recorder)
+    # The replay answers the master port itself.
+    await core_mini_axi.init(memory_agents=False)
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    for _ in range(10):
+      addr = random.randint(0x10000, 0x17FFF)
+      length = random.randint(1, min(256, 0x18000 - addr))
+      wdata = np.random.randint(0, 255, length, dtype=np.uint8)
+      await core_mini_axi.write(addr, wdata)
+      rdata = await core_mini_axi.read(addr, length)
+      assert (wdata == rdata).all()
+
+    path = os.path.join(os.environ.get("TEST_TMPDIR", "/tmp"), "axi_record.npy")
+    recorder.save(path)
+    core_mini_axi.recorder = None
+    records = load_recording(path)
+
+    async def reset_and_clear():
+      # Replay into a reset DUT whose DTCM no longer holds the recorded data,
+      # so reads only match if the replayed writes landed.
+      await core_mini_axi.reset()
+      await core_mini_axi.write(0x10000, np.zeros([0x8000], dtype=np.uint8))
+
+    await reset_and_clear()
+    mismatches = await AxiReplay(core_mini_axi, records).run()
+    assert mismatches == [], mismatches
+
+    # Corrupting the data of the first write must be caught on the read back.
+    corrupted = np.array(records)
+    first_w = np.flatnonzero((corrupted["port"] == AxiPort.SLAVE) &
+                             (corrupted["channel"] == AxiChannel.W))[0]
+    corrupted["data"][first_w] ^= 0xFF
+    await reset_and_clear()
+    mismatches = await AxiReplay(core_mini_axi, corrupted).run()
+    assert mismatches, "corrupted recording replayed without mismatches"
+
+@cocotb.test()
+async def core_mini_axi_memory_timing_test(dut):
+    """Runs a program using external memory behind a slow memory model."""
+    timing = MemoryTiming(read_latency=40, write_latency=20, beat_cycles=2,
+                          max_outstanding_reads=2, max_outstanding_writes=2)
+    core_mini_axi = CoreMiniAxiInterface(dut, memory_timing=timing)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+    r = runfiles.Create()
+
+    with open(r.Rlocation("coralnpu_hw/tests/cocotb/finish_txn_before_halt.elf"), "rb") as f:
+      entry_point = await core_mini_axi.load_elf(f)
+      await core_mini_axi.execute_from(entry_point)
+      await core_mini_axi.wait_for_halted(timeout_cycles=100000)
+      assert core_mini_axi.dut.io_fault.value == 0
+
+    stats = core_mini_axi.memory_timing.stats()
+    assert stats["row_hits"] + stats["row_misses"] > 0
+
+@cocotb.test()
+async def core_mini_axi_shared_memory_test(dut):
+    """Checks that a client attached by name shares external memory."""
+    name = f"coralnpu_ext_mem_{os.getpid()}"
+    core_mini_axi = CoreMiniAxiInterface(dut, ext_mem_shm_name=name)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    client = attach_memory(name=name)
+    try:
+      wdata = np.random.randint(0, 255, 256, dtype=np.uint8)
+      client.write(0x20000100, wdata)
+      rdata = await core_mini_axi.read(0x20000100, 256)
+      assert (wdata == rdata).all()
+
+      wdata = np.random.randint(0, 255, 256, dtype=np.uint8)
+      await core_mini_axi.write(0x20000200, wdata)
+      assert (client.view(0x20000200, 256) == wdata).all()
+    finally:
+      client.close()
+      core_mini_axi.memory.unlink()
+
+@cocotb.test()
+async def core_mini_axi_write_combining_test(dut):
+    """Checks that buffered word writes are combined into one burst."""
+    core_mini_axi = CoreMiniAxiInterface(dut, axi_stats=True,
+                                         write_combining=True)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    words = np.random.randint(0, 2**32, 32, dtype=np.uint32)
+    for i in reversed(range(len(words))):
+      await core_mini_axi.write_buffered(0x10000 + 4 * i, words[i:i + 1])
+    # Later writes to the same bytes win.
+    await core_mini_axi.write_buffered(0x10004, np.array([0x12345678],
+                                                         dtype=np.uint32))
+    words[1] = 0x12345678
+    assert core_mini_axi.stats["slave"].handshakes["aw"] == 0
+
+    # The overlapping read flushes the buffer.
+    rdata = await core_mini_axi.read(0x10000, 128)
+    assert (rdata.view(np.uint32) == words).all()
+    assert core_mini_axi.stats["slave"].handshakes["aw"] == 1
+    assert not core_mini_axi.pending_writes
+
+@cocotb.test()
+async def core_mini_axi_read_into_test(dut):
+    """Checks reads into caller buffers and read-only local memory views."""
+    core_mini_axi = CoreMiniAxiInterface(dut)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    wdata = np.random.randint(0, 2**16, [8, 12], dtype=np.uint16)
+    await core_mini_axi.write(0x10006, wdata)
+    out = np.zeros([8, 12], dtype=np.uint16)
+    for max_outstanding in [1, 4]:
+      out[:] = 0
+      result = await core_mini_axi.read_into(0x10006, out,
+                                             max_outstanding=max_outstanding)
+      assert result is out
+      assert (out == wdata).all()
+
+    # read() returns an owned copy, read_array() a read-only view.
+    await core_mini_axi.write(0x20000100, wdata)
+    rdata = await core_mini_axi.read(0x20000100, wdata.nbytes)
+    view = await core_mini_axi.read_array(0x20000100, np.uint16, [8, 12])
+    assert rdata.flags.writeable
+    assert not view.flags.writeable
+    assert (rdata.view(np.uint16).reshape([8, 12]) == wdata).all()
+    assert (view == wdata).all()
+    await core_mini_axi.write(0x20000100, ~wdata)
+    assert (rdata.view(np.uint16).reshape([8, 12]) == wdata).all()
+
+@cocotb.test()
+async def core_mini_axi_fast_forward_test(dut):
+    """Checks that the slave port works again after fast-forwarding."""
+    core_mini_axi = CoreMiniAxiInterface(dut)
+    await core_mini_axi.init()
+    await core_mini_axi.reset()
+    cocotb.start_soon(core_mini_axi.clock.start())
+
+    wdata = np.random.randint(0, 255, 64, dtype=np.uint8)
+    await core_mini_axi.write(0x10000, wdata)
+    async with core_mini_axi.fast_forward():
+      await ClockCycles(dut.io_aclk, 100)
+    rdata = await core_mini_axi.read(0x10000, 64)
+    assert (wdata == rdata).all()
+
+    # Transactions still in flight complete before the agents are parked.
+    wdata = np.random.randint(0, 255, 256, dtype=np.uint8)
+    write = cocotb.start_soon(core_mini_axi.write(0x10100, wdata,
+                                                  max_outstanding=4))
+    await ClockCycles(dut.io_aclk, 2)
+    async with core_mini_axi.fast_forward():
+      assert core_mini_axi.slave_writes_in_flight == 0
+      await ClockCycles(dut.io_aclk, 100)
+    await write
+    rdata = await core_mini_axi.read(0x10100, 256)
+    assert (wdata == rdata).all()
+
+@cocotb.test()
+async def core_mini_axi_snapshot_restore_test(dut):
+    """Checks that restore() undoes writes and snapshots are copy-on-write."""
+    fixture = await Fixture.Create(dut)
+    core_mini_axi = fixture.core_mini_axi
+    r = runfiles.Create()
+    await fixture.load_elf_and_lookup_symbols(
+        r.Rlocation("coralnpu_hw/tests/cocotb/finish_txn_before_halt.elf"), [])
+    tcm_addr, tcm_size = core_mini_axi.loaded_segments[0]
+    tcm_data = await core_mini_axi.read(tcm_addr, tcm_size)
+
+    page_size = core_mini_axi.memory.page_size
+    ext_addr = core_mini_axi.memory_base_addr + 0x10000
+    ext_data = np.random.randint(0, 255, 256, dtype=np.uint8)
+    await core_mini_axi.write(ext_addr, ext_data)
+    snap = await fixture.snapshot()
+
+    # Mutate a snapshotted page, a fresh page and the loaded TCM image.
+    new_page_addr = ext_addr + 4 * page_size
+    await core_mini_axi.write(ext_addr, ~ext_data)
+    await core_mini_axi.write(new_page_addr, ext_data)
+    await core_mini_axi.write(tcm_addr, np.zeros([tcm_size], dtype=np.uint8))
+    # The snapshot keeps its own copy of the written page.
+    page = snap.memory.pages[0x10000 // page_size]
+    assert (page[:256] == ext_data).all()
+
+    await fixture.restore(snap)
+    assert (await core_mini_axi.read(ext_addr, 256) == ext_data).all()
+    assert (await core_mini_axi.read(new_page_addr, 256) == 0).all()
+    assert (await core_mini_axi.read(tcm_addr, tcm_size) == tcm_data).all()
+
+    # Restored pages are shared with the snapshot again, and stay isolated.
+    await core_mini_axi.write(ext_addr, ~ext_data)
+    assert (page[:256] == ext_data).all()
+    await fixture.restore(snap)
+    assert (await core_mini_axi.read(ext_addr, 256) == ext_data).all()
+
+@cocotb.test()
+async def axi_slave_burst_test(dut):
+    """Checks AxiSlave bursts, byte lanes, latencies and pipelined responses."""
+    cocotb.start_soon(Clock(dut.io_aclk, 1.25, unit="ns").start())
+    base = 0x20000000
+    read_latency = 10
+    write_latency = 5
+    # Only the handlers run, fed through the queues, since the master port
+    # needs no driver for them to be tested.
+    slave = AxiSlave(dut, "axi_master", dut.io_aclk, dut.io_aresetn, dut._log,
+                     has_memory=True, mem_base_addr=base, mem_size=0x10000,
+                     read_latency=read_latency, write_latency=write_latency)
+    slave.start(port_agents=False)
+    await ClockCycles(dut.io_aclk, 1)
+
+    def beat_bytes(rdata):
+      return np.frombuffer(rdata["data"].to_bytes(16, byteorder="little"),
+                           dtype=np.uint8)
+
+    async def write(addr, size, lines, strbs, burst=AxiBurst.INCR, axi_id=1):
+      cycle = slave.cycle
+      await slave.aw_queue.put({"id": axi_id, "addr": addr, "size": size,
+                                "len": len(lines) - 1, "burst": burst,
+                                "cycle": cycle})
+      for i, (line, strb) in enumerate(zip(lines, strbs)):
+        # W beats are captured most significant byte first.
+        await slave.w_queue.put({"data": line[::-1].tobytes(), "strb": strb,
+                                 "last": i == len(lines) - 1, "cycle": cycle})
+      bdata = await slave.b_queue.get()
+      # The cycle counter may tick after the handler wakes on the same edge.
+      assert slave.cycle >= cycle + write_latency - 1
+      return bdata
+
+    async def read(addr, size, length, burst=AxiBurst.INCR, axi_id=2):
+      cycle = slave.cycle
+      await slave.ar_queue.put({"id": axi_id, "addr": addr, "size": size,
+                                "len": length - 1, "burst": burst,
+                                "cycle": cycle})
+      beats = [await slave.r_queue.get() for _ in range(length)]
+      # The cycle counter may tick after the handler wakes on the same edge.
+      assert slave.cycle >= cycle + read_latency - 1
+      assert [b["last"] for b in beats] == [0] * (length - 1) + [1]
+      assert all(b["id"] == axi_id for b in beats)
+      return beats
+
+    # A 4-beat INCR write with a partially strobed beat, read back as a burst.
+    lines = np.random.randint(0, 256, [4, 16], dtype=np.uint8)
+    bdata = await write(base + 0x100, 4, lines, [0xFFFF, 0x00FF, 0xFFFF, 0xFFFF])
+    assert bdata == {"id": 1, "resp": AxiResp.OKAY}
+    expected = lines.copy()
+    expected[1, 8:] = 0xBD
+    beats = await read(base + 0x100, 4, 4)
+    assert all(b["resp"] == AxiResp.OKAY for b in beats)
+    assert (np.array([beat_bytes(b) for b in beats]) == expected).all()
+
+    # WRAP bursts wrap at the burst size, 64 bytes here.
+    beats = await read(base + 0x120, 4, 4, burst=AxiBurst.WRAP)
+    assert (np.array([beat_bytes(b) for b in beats]) ==
+            expected[[2, 3, 0, 1]]).all()
+
+    # Narrow accesses use the byte lanes of their address, as the AXI spec
+    # requires, for both writes and reads.
+    word = np.zeros([16], dtype=np.uint8)
+    word[4:8] = [1, 2, 3, 4]
+    await write(base + 0x204, 2, [word], [0x00F0])
+    (beat,) = await read(base + 0x204, 2, 1)
+    assert (beat_bytes(beat)[4:8] == [1, 2, 3, 4]).all()
+
+    # Responses to addresses accepted together are not serialized by latency.
+    start = slave.cycle
+    for i in range(4):
+      await slave.ar_queue.put({"id": i, "addr": base + 0x100 + 16 * i,
+                                "size": 4, "len": 0, "burst": AxiBurst.INCR,
+                                "cycle": start})
+    for i in range(4):
+      rdata = await slave.r_queue.get()
+      assert rdata["id"] == i
+      assert (beat_bytes(rdata) == expected[i]).all()
+    assert slave.cycle < start + 2 * read_latency
+
+    # Beats outside the memory get SLVERR.
+    (beat,) = await read(base + 0x10000, 4, 1)
+    assert beat["resp"] == AxiResp.SLVERR
@@ -41,8 +41,7 @@ async def core_mini_rvv_matmul_test(dut):
         await fixture.write('lhs_input', lhs_data.flatten())
         await fixture.write('rhs_input', rhs_data.transpose().flatten())
         await fixture.run_to_halt(timeout_cycles=1000000)
-        output_matmul_result = (await fixture.read(
-            'result_output', LHS_ROWS * RHS_COLS *
-            4)).view(dtype=np.int32).reshape([LHS_ROWS, RHS_COLS])
+        output_matmul_result = await fixture.read_array(
+            'result_output', np.int32, [LHS_ROWS, RHS_COLS])
 
         assert ((result_data == output_matmul_result).all())
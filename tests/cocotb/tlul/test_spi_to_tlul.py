@@ -18,6 +18,7 @@ import os
 import math
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge, ClockCycles, FallingEdge
+from cocotb.utils import get_sim_time
 from coralnpu_test_utils.TileLinkULInterface import TileLinkULInterface
 from coralnpu_test_utils.spi_master import SPIMaster
 from coralnpu_test_utils.spi_constants import SpiRegAddress, SpiCommand, TlStatus
@@ -1000,3 +1001,105 @@ async def test_large_write_then_pipelined_read(dut):
     await responder_task
     dut._log.info("--- Large Write/Pipelined Read Test Passed ---")
 
+
+@cocotb.test()
+async def test_spi_clock_ratio(dut):
+    """Runs the same packed write and bulk read at a 1:1 SPI clock and at MAX_CLOCK_RATIO."""
+    clock = Clock(dut.clock, 10)
+    cocotb.start_soon(clock.start())
+
+    def make_spi_master(max_clock_ratio):
+        return SPIMaster(
+            clk=dut.io_spi_clk,
+            csb=dut.io_spi_csb,
+            mosi=dut.io_spi_mosi,
+            miso=dut.io_spi_miso,
+            main_clk=dut.clock,
+            log=dut._log,
+            max_clock_ratio=max_clock_ratio,
+        )
+
+    await setup_dut(dut, make_spi_master(False))
+    tl_device = TileLinkULInterface(dut, device_if_name="io_tl", width=128)
+    await tl_device.init()
+
+    num_beats = 4
+    target_addr = 0x40001000
+    data = [random.getrandbits(128) for _ in range(num_beats)]
+    expected_bytes = b"".join(word.to_bytes(16, "little") for word in data)
+
+    async def transfer(spi_master):
+        received_writes = []
+
+        async def write_responder():
+            for _ in range(num_beats):
+                req = await tl_device.device_get_request()
+                assert int(req['opcode']) in [0, 1], f"Expected PutFullData or PutPartialData, got opcode {req['opcode']}"
+                received_writes.append(int(req['data']))
+                await tl_device.device_respond(
+                    opcode=0,  # AccessAck
+                    param=0,
+                    size=req['size'],
+                    source=req['source'],
+                    error=0,
+                    width=128
+                )
+
+        responder_task = cocotb.start_soon(write_responder())
+        await spi_master.packed_write_transaction(target_addr=target_addr, data=data)
+        assert await spi_master.poll_reg_for_value(SpiRegAddress.TL_WRITE_STATUS_REG, TlStatus.DONE), "Timed out waiting for write status to be Done"
+        await spi_master.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_NULL)
+        await responder_task
+
+        async def read_responder():
+            for i in range(num_beats):
+                req = await tl_device.device_get_request()
+                assert int(req['opcode']) == 4, f"Expected Get opcode (4), got {req['opcode']}"
+                await tl_device.device_respond(
+                    opcode=1,  # AccessAckData
+                    param=0,
+                    size=req['size'],
+                    source=req['source'],
+                    data=received_writes[i],
+                    error=0,
+                    width=128
+                )
+
+        responder_task = cocotb.start_soon(read_responder())
+        for j in range(4):
+            await spi_master.write_reg(SpiRegAddress.TL_ADDR_REG_0 + j, (target_addr >> (j * 8)) & 0xFF)
+        await spi_master.write_reg_16b(SpiRegAddress.TL_LEN_REG_L, num_beats - 1)
+        await spi_master.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_READ_START, wait_cycles=0)
+        assert await spi_master.poll_reg_for_value(SpiRegAddress.TL_STATUS_REG, TlStatus.DONE), "Timed out waiting for status to be Done"
+        read_bytes = bytes(await spi_master.bulk_read(num_beats * 16))
+        await spi_master.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_NULL)
+        await responder_task
+
+        written_bytes = b"".join(word.to_bytes(16, "little") for word in received_writes)
+        return written_bytes, read_bytes
+
+    async def measure_period(clk):
+        await RisingEdge(clk)
+        start = get_sim_time(unit="step")
+        await RisingEdge(clk)
+        return get_sim_time(unit="step") - start
+
+    results = {}
+    for max_clock_ratio in [False, True]:
+        spi_master = make_spi_master(max_clock_ratio)
+        results[max_clock_ratio] = await transfer(spi_master)
+
+        main_period = await measure_period(dut.clock)
+        await spi_master.start_clock()
+        spi_period = await measure_period(dut.io_spi_clk)
+        await spi_master.stop_clock()
+        ratio = main_period / spi_period
+        assert ratio <= SPIMaster.MAX_CLOCK_RATIO, f"SPI clock is {ratio}x the main clock"
+        if max_clock_ratio:
+            assert ratio == SPIMaster.MAX_CLOCK_RATIO, f"SPI clock is {ratio}x the main clock"
+
+        written_bytes, read_bytes = results[max_clock_ratio]
+        assert written_bytes == expected_bytes, f"max_clock_ratio={max_clock_ratio}: written data mismatch"
+        assert read_bytes == expected_bytes, f"max_clock_ratio={max_clock_ratio}: read data mismatch"
+
+    assert results[False] == results[True], "Transfers differ between 1:1 and MAX_CLOCK_RATIO"
@@ -23,7 +23,7 @@ from bazel_tools.tools.python.runfiles import runfiles
 @cocotb.test()
 async def core_mini_rvv_mobilenet_v1(dut):
 
-    fixture = await Fixture.Create(dut, highmem=True)
+    fixture = await Fixture.Create(dut, highmem=True, backdoor_load=True)
     r = runfiles.Create()
     elf_files = ['run_mobilenet_v1_025_partial_binary.elf']
 
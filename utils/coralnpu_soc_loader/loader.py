@@ -14,6 +14,7 @@
 
 import argparse
 import logging
+import sys
 import time
 
 from elftools.elf.elffile import ELFFile
@@ -36,49 +37,65 @@ def write_lines_via_spi(driver: SPIDriver, address: int, data_bytes: bytes):
     """Writes multiple 16-byte bus lines to a given address via the SPI bridge."""
     if len(data_bytes) % 16 != 0:
         raise ValueError("Data length must be a multiple of 16 bytes")
-    num_lines = len(data_bytes) // 16
-    if num_lines == 0:
+    if not data_bytes:
         return
 
-    data_int = int.from_bytes(data_bytes, byteorder='little')
+    with driver.batch() as batch:
+        # 1. Use the packed write transaction for efficiency
+        batch.packed_write(address, data_bytes)
 
-    # 1. Use the packed write transaction for efficiency
-    driver.packed_write_transaction(address, num_lines, data_int)
+        # 2. Poll status register until the transaction is done
+        done = batch.poll_reg_for_value(SpiRegAddress.TL_WRITE_STATUS_REG, TlStatus.DONE,
+                                        abort_on_failure=True)
 
-    # 2. Poll status register until the transaction is done
-    if not driver.poll_reg_for_value(SpiRegAddress.TL_WRITE_STATUS_REG, TlStatus.DONE):
+        # 3. Clear the status to return FSM to Idle
+        batch.write_reg(SpiRegAddress.TL_CMD_REG, TlStatus.IDLE)
+    if not done.value:
         raise RuntimeError(f"Timed out waiting for SPI write to 0x{address:08x} to complete")
 
-    # 3. Clear the status to return FSM to Idle
+
+def write_lines_unbatched(driver: SPIDriver, address: int, data_bytes: bytes):
+    """Writes lines with one round trip per command, as before batching.
+
+    Only used as the baseline for --benchmark.
+    """
+    num_lines = len(data_bytes) // 16
+    driver.packed_write_transaction(address, num_lines,
+                                    int.from_bytes(data_bytes, byteorder='little'))
+    if not driver.poll_reg_for_value(SpiRegAddress.TL_WRITE_STATUS_REG, TlStatus.DONE):
+        raise RuntimeError(f"Timed out waiting for SPI write to 0x{address:08x} to complete")
     driver.write_reg(SpiRegAddress.TL_CMD_REG, TlStatus.IDLE)
 
 
 def read_line_via_spi(driver: SPIDriver, address: int) -> int:
-    """Reads a single 128-bit line from memory via SPI."""
-    # 1. Configure the read
-    driver.write_reg(SpiRegAddress.TL_ADDR_REG_0, (address >> 0) & 0xFF)
-    driver.write_reg(SpiRegAddress.TL_ADDR_REG_1, (address >> 8) & 0xFF)
-    driver.write_reg(SpiRegAddress.TL_ADDR_REG_2, (address >> 16) & 0xFF)
-    driver.write_reg(SpiRegAddress.TL_ADDR_REG_3, (address >> 24) & 0xFF)
-    driver.write_reg_16b(SpiRegAddress.TL_LEN_REG_L, 0) # 1 beat
-
-    # 2. Issue the read command
-    driver.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_READ_START)
-
-    # 3. Poll for completion
-    if not driver.poll_reg_for_value(SpiRegAddress.TL_STATUS_REG, TlStatus.DONE):
+    """Reads a single 128-bit line from memory via SPI, in one batch."""
+    with driver.batch() as batch:
+        # 1. Configure the read
+        batch.write_reg(SpiRegAddress.TL_ADDR_REG_0, (address >> 0) & 0xFF)
+        batch.write_reg(SpiRegAddress.TL_ADDR_REG_1, (address >> 8) & 0xFF)
+        batch.write_reg(SpiRegAddress.TL_ADDR_REG_2, (address >> 16) & 0xFF)
+        batch.write_reg(SpiRegAddress.TL_ADDR_REG_3, (address >> 24) & 0xFF)
+        batch.write_reg_16b(SpiRegAddress.TL_LEN_REG_L, 0) # 1 beat
+
+        # 2. Issue the read command
+        batch.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_READ_START)
+
+        # 3. Poll for completion, skipping the rest of the batch on timeout
+        done = batch.poll_reg_for_value(SpiRegAddress.TL_STATUS_REG, TlStatus.DONE,
+                                        abort_on_failure=True)
+
+        # 4. Check bytes available and read the data
+        bytes_available = batch.read_spi_domain_reg_16b(SpiRegAddress.BULK_READ_STATUS_REG_L)
+        read_data_bytes = batch.bulk_read(16)
+
+        # 5. Clear the command register
+        batch.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_NULL)
+
+    if not done.value:
         raise RuntimeError(f"Timed out waiting for TL read at address 0x{address:x} to complete.")
-
-    # 4. Check bytes available and read the data using the new method
-    bytes_available = driver.read_spi_domain_reg_16b(SpiRegAddress.BULK_READ_STATUS_REG_L)
-    if bytes_available != 16:
-        raise RuntimeError(f"Expected 16 bytes, but status reg reported {bytes_available}")
-    read_data_bytes = driver.bulk_read(bytes_available)
-    read_data = int.from_bytes(bytes(read_data_bytes), 'little')
-
-    # 5. Clear the command register
-    driver.write_reg(SpiRegAddress.TL_CMD_REG, SpiCommand.CMD_NULL)
-    return read_data
+    if bytes_available.value != 16:
+        raise RuntimeError(f"Expected 16 bytes, but status reg reported {bytes_available.value}")
+    return int.from_bytes(read_data_bytes.value, 'little')
 
 def write_word_via_spi(driver: SPIDriver, address: int, data: int):
     """Writes a 32-bit value by performing a read-modify-write on a 16-byte line."""
@@ -97,12 +114,41 @@ def write_word_via_spi(driver: SPIDriver, address: int, data: int):
     # Write the modified line back
     write_line_via_spi(driver, line_addr, updated_data)
 
+def read_word_via_spi(driver: SPIDriver, address: int) -> int:
+    """Reads a 32-bit value out of its 16-byte line."""
+    line_data = read_line_via_spi(driver, (address // 16) * 16)
+    return (line_data >> ((address % 16) * 8)) & 0xFFFFFFFF
+
+def wait_for_halt(driver: SPIDriver, status_addr: int, timeout: float,
+                  interval: float = 0.05):
+    """Polls the core status CSR until the core halts or `timeout` seconds pass.
+
+    Returns the status value (bit 0 halted, bit 1 fault), or None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        status = read_word_via_spi(driver, status_addr)
+        if status & 1:
+            return status
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+
 def main():
     parser = argparse.ArgumentParser(description="Load an ELF binary to the CoralNPU SoC.")
     parser.add_argument("binary", help="Path to the ELF binary to load.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Load unbatched, then batched, and report both rates.")
+    parser.add_argument("--wait_for_halt", action="store_true",
+                        help="After starting the program, wait until the core halts.")
+    parser.add_argument("--halt_timeout", type=float, default=10,
+                        help="Seconds to wait for the core to halt with --wait_for_halt.")
+    parser.add_argument("--require_halt", action="store_true",
+                        help="Exit non-zero if the core doesn't halt within --halt_timeout.")
     args = parser.parse_args()
 
     driver = None
+    exit_code = 0
     try:
         driver = SPIDriver()
 
@@ -122,6 +168,7 @@ def main():
             elffile = ELFFile(f)
             entry_point = elffile.header.e_entry
 
+            pages = []
             for segment in elffile.iter_segments():
                 if segment['p_type'] != 'PT_LOAD':
                     continue
@@ -130,28 +177,38 @@ def main():
                 data = segment.data()
                 logging.warning(f"LOADER: Loading segment to address 0x{paddr:08x}, size {len(data)} bytes")
 
-                # Load data in pages of up to 16 lines (256 bytes)
-                original_len = len(data)
                 # Pad data to be a multiple of 16 bytes (a line)
                 if len(data) % 16 != 0:
                     data += b'\x00' * (16 - (len(data) % 16))
 
+                # Split data into pages of up to 256 lines (4 KiB)
                 page_size = 4096
                 for i in range(0, len(data), page_size):
-                    page_addr = paddr + i
-                    page_data_bytes = data[i:i+page_size]
-
-                    write_lines_via_spi(driver, page_addr, page_data_bytes)
-
-                    bytes_written = min(i + len(page_data_bytes), original_len)
-                    logging.warning(f"  ... wrote {bytes_written}/{original_len} bytes")
-                logging.warning(f"  ... wrote {original_len}/{original_len} bytes")
+                    pages.append((paddr + i, data[i:i+page_size]))
+
+        total_bytes = sum(len(page_data) for _, page_data in pages)
+        loaders = [("batched", write_lines_via_spi)]
+        if args.benchmark:
+            loaders.insert(0, ("unbatched", write_lines_unbatched))
+        rates = {}
+        for name, write_lines in loaders:
+            start = time.monotonic()
+            for page_addr, page_data in pages:
+                write_lines(driver, page_addr, page_data)
+            elapsed = time.monotonic() - start
+            rates[name] = total_bytes / 1024 / elapsed if elapsed > 0 else float('inf')
+            logging.warning(f"LOADER: Wrote {total_bytes} bytes in {len(pages)} pages ({name}): "
+                            f"{elapsed:.2f}s, {rates[name]:.1f} KB/s")
+        if len(rates) > 1:
+            logging.warning(f"LOADER: Batched speedup over unbatched: "
+                            f"{rates['batched'] / rates['unbatched']:.2f}x")
 
         logging.warning("LOADER: Binary loaded successfully.")
 
         # --- Execute Program ---
         coralnpu_pc_csr_addr = 0x30004
         coralnpu_reset_csr_addr = 0x30000
+        coralnpu_status_csr_addr = 0x30008
 
         logging.warning(f"LOADER: Programming start PC to 0x{entry_point:08x}")
         write_word_via_spi(driver, coralnpu_pc_csr_addr, entry_point)
@@ -164,12 +221,27 @@ def main():
 
         logging.warning("LOADER: Execution started.")
 
+        if args.wait_for_halt:
+            logging.warning(f"LOADER: Waiting up to {args.halt_timeout}s for the core to halt...")
+            start = time.monotonic()
+            status = wait_for_halt(driver, coralnpu_status_csr_addr, args.halt_timeout)
+            if status is None:
+                if args.require_halt:
+                    raise RuntimeError(f"Timed out after {args.halt_timeout}s waiting for the core to halt.")
+                logging.warning(f"LOADER: Core still running after {args.halt_timeout}s, stopping.")
+            elif status & 2:
+                raise RuntimeError("Core halted with a fault.")
+            else:
+                logging.warning(f"LOADER: Core halted after {time.monotonic() - start:.2f}s.")
+
     except Exception as e:
         logging.error(f"An error occurred: {e}")
+        exit_code = 1
     finally:
         if driver:
             logging.info("LOADER: Closing connection.")
             driver.close()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -16,10 +16,12 @@
 import argparse
 import logging
 import os
+import shutil
 import signal
 import socket
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 
@@ -34,13 +36,18 @@ def find_free_port():
         return s.getsockname()[1]
 
 
-def stream_reader(pipe, prefix, ready_event=None, ready_line=None):
-    """Reads and prints lines from a subprocess pipe."""
+def stream_reader(pipe, prefix, watches=()):
+    """Reads and prints lines from a subprocess pipe.
+
+    `watches` is a list of (text, event) pairs; each event is set once a line
+    containing its text is read.
+    """
     try:
         for line in iter(pipe.readline, ""):
             logging.warning(f"[{prefix}] {line.strip()}")
-            if ready_event and ready_line and ready_line in line:
-                ready_event.set()
+            for text, event in watches:
+                if text in line:
+                    event.set()
     finally:
         pipe.close()
 
@@ -50,8 +57,22 @@ def main():
     parser = argparse.ArgumentParser(description="Run the CoralNPU SoC simulation and load an ELF binary.")
     parser.add_argument("--elf_file", required=True, help="Path to the ELF binary to load.")
     parser.add_argument("--trace_file", help="Optional: Path to save a waveform trace file (.fst).")
-    parser.add_argument("--run_time", type=int, default=10, help="Optional: Time in seconds to run simulation after loading.")
+    parser.add_argument("--run_time", type=int, default=10,
+                        help="Optional: Maximum time in seconds to run the simulation after loading.")
+    parser.add_argument("--wait_for", choices=["halt", "marker", "time"], default="halt",
+                        help="Optional: Stop once the core halts (default), once the simulator prints "
+                             "--halt_marker, or only after --run_time.")
+    parser.add_argument("--halt_marker",
+                        help="Optional: Stop the simulation once the simulator prints this text, e.g. a UART "
+                             "message. Required with --wait_for=marker.")
+    parser.add_argument("--require_halt", action="store_true",
+                        help="Optional: Exit non-zero if the core doesn't halt (or print --halt_marker) within "
+                             "--run_time. By default the simulation just stops with a warning.")
+    parser.add_argument("--transport", choices=["unix", "tcp"], default="unix",
+                        help="Optional: Connect the loader to the simulator over a Unix domain socket (default) or TCP.")
     args = parser.parse_args()
+    if args.wait_for == "marker" and not args.halt_marker:
+        parser.error("--wait_for=marker requires --halt_marker")
 
     r = runfiles.Create()
     # The genrule copies the binary to a predictable path.
@@ -64,14 +85,25 @@ def main():
         if not sim_bin_path or not os.path.exists(sim_bin_path):
             raise FileNotFoundError(f"Could not find simulator binary in runfiles at default or fallback paths.")
 
-    port = find_free_port()
-    logging.warning(f"RUNNER: Found free TCP port: {port}")
-
     sim_env = os.environ.copy()
-    sim_env["SPI_DPI_PORT"] = str(port)
+    socket_dir = None
+    if args.transport == "unix":
+        # A private directory avoids racing other runs for a free port.
+        socket_dir = tempfile.mkdtemp(prefix="coralnpu_spi_")
+        socket_path = os.path.join(socket_dir, "spi_dpi.sock")
+        sim_env["SPI_DPI_SOCKET"] = socket_path
+        ready_line = f"DPI: Server listening on unix socket {socket_path}"
+        logging.warning(f"RUNNER: Using unix socket: {socket_path}")
+    else:
+        port = find_free_port()
+        logging.warning(f"RUNNER: Found free TCP port: {port}")
+        sim_env.pop("SPI_DPI_SOCKET", None)
+        sim_env["SPI_DPI_PORT"] = str(port)
+        ready_line = f"DPI: Server listening on port {port}"
 
     sim_proc = None
     loader_proc = None
+    loader_stopped = False
     threads = []
 
     try:
@@ -90,9 +122,13 @@ def main():
         )
 
         sim_ready_event = threading.Event()
+        sim_watches = [(ready_line, sim_ready_event)]
+        marker_event = threading.Event()
+        if args.halt_marker:
+            sim_watches.append((args.halt_marker, marker_event))
 
         # Start threads to monitor simulator output
-        threads.append(threading.Thread(target=stream_reader, args=(sim_proc.stdout, "SIM", sim_ready_event, f"DPI: Server listening on port {port}")))
+        threads.append(threading.Thread(target=stream_reader, args=(sim_proc.stdout, "SIM", sim_watches)))
         threads.append(threading.Thread(target=stream_reader, args=(sim_proc.stderr, "SIM_ERR")))
         for t in threads:
             t.start()
@@ -106,9 +142,17 @@ def main():
         if not loader_script_path or not os.path.exists(loader_script_path):
             raise FileNotFoundError("Could not find loader binary in runfiles.")
 
-        logging.warning(f"RUNNER: Starting ELF loader: {loader_script_path}")
+        loader_cmd = [loader_script_path, args.elf_file]
+        if args.wait_for == "halt":
+            # The loader holds the only DPI connection, so it polls the
+            # status CSR itself once the program is started.
+            loader_cmd += ["--wait_for_halt", f"--halt_timeout={args.run_time}"]
+            if args.require_halt:
+                loader_cmd.append("--require_halt")
+
+        logging.warning(f"RUNNER: Starting ELF loader: {' '.join(loader_cmd)}")
         loader_proc = subprocess.Popen(
-            [loader_script_path, args.elf_file],
+            loader_cmd,
             env=sim_env,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -123,9 +167,34 @@ def main():
         threads.extend([loader_stdout_thread, loader_stderr_thread])
 
         # Wait for processes to complete
-        loader_proc.wait(timeout=300)
-        logging.warning(f"RUNNER: Loader finished. Running simulation for {args.run_time} seconds...")
-        time.sleep(args.run_time)
+        start = time.monotonic()
+        if args.wait_for == "halt":
+            logging.warning(f"RUNNER: Waiting for the loader and for the core to halt, "
+                            f"at most {args.run_time} seconds after loading...")
+            while loader_proc.poll() is None and not marker_event.is_set():
+                if time.monotonic() - start > 300 + args.run_time:
+                    raise subprocess.TimeoutExpired(loader_cmd, 300 + args.run_time)
+                time.sleep(0.05)
+        else:
+            loader_proc.wait(timeout=300)
+            logging.warning(f"RUNNER: Loader finished. Running simulation for at most {args.run_time} seconds...")
+            if args.wait_for == "marker":
+                if not marker_event.wait(timeout=args.run_time):
+                    if args.require_halt:
+                        raise RuntimeError(f"Did not see halt marker {args.halt_marker!r} "
+                                           f"within {args.run_time} seconds.")
+                    logging.warning(f"RUNNER: Did not see halt marker {args.halt_marker!r} "
+                                    f"within {args.run_time} seconds.")
+            else:
+                time.sleep(args.run_time)
+        if marker_event.is_set():
+            logging.warning(f"RUNNER: Saw halt marker {args.halt_marker!r}.")
+            if loader_proc.poll() is None:
+                # The loader was only waiting for the halt the marker reported.
+                loader_proc.terminate()
+                loader_proc.wait(timeout=10)
+                loader_stopped = True
+        logging.warning(f"RUNNER: Stopping simulation after {time.monotonic() - start:.2f} seconds.")
 
         logging.warning("RUNNER: Sending SIGINT to simulator for graceful shutdown...")
         sim_proc.send_signal(signal.SIGINT)
@@ -133,7 +202,7 @@ def main():
         logging.warning("RUNNER: Simulation finished.")
 
     except (subprocess.TimeoutExpired, RuntimeError) as e:
-        logging.error(f"RUNNER: An error occurred: {e}", file=sys.stderr)
+        logging.error(f"RUNNER: An error occurred: {e}")
         if sim_proc:
             sim_proc.kill()
         if loader_proc:
@@ -142,14 +211,16 @@ def main():
     finally:
         for t in threads:
             t.join()
+        if socket_dir:
+            shutil.rmtree(socket_dir, ignore_errors=True)
         logging.warning("RUNNER: All processes terminated.")
 
-    if loader_proc and loader_proc.returncode != 0:
-        logging.error(f"RUNNER: Loader exited with non-zero status: {loader_proc.returncode}", file=sys.stderr)
+    if loader_proc and loader_proc.returncode != 0 and not loader_stopped:
+        logging.error(f"RUNNER: Loader exited with non-zero status: {loader_proc.returncode}")
         sys.exit(loader_proc.returncode)
 
     if sim_proc and sim_proc.returncode != 0 and sim_proc.returncode != -15: # -15 is SIGTERM
-         logging.error(f"RUNNER: Simulator exited with non-zero status: {sim_proc.returncode}", file=sys.stderr)
+         logging.error(f"RUNNER: Simulator exited with non-zero status: {sim_proc.returncode}")
          sys.exit(sim_proc.returncode)
 
     logging.warning("RUNNER: Simulation completed successfully.")
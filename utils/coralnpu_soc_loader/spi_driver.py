@@ -16,9 +16,121 @@ import os
 import socket
 import struct
 
+class _BatchResult:
+    """The result of a command in an SPIBatch, available once it was sent."""
+
+    def __init__(self, batch, cmd_type):
+        self.batch = batch
+        self.cmd_type = cmd_type
+        self.done = False
+        self.skipped = False
+        self._value = None
+
+    @property
+    def value(self):
+        """Returns the command's result, flushing the batch if needed."""
+        if not self.done:
+            self.batch.flush()
+        if self.skipped:
+            raise RuntimeError(
+                f"SPI command {self.cmd_type} failed, or was skipped after a failed poll.")
+        return self._value
+
+
+class SPIBatch:
+    """Collects SPIDriver commands and sends them as BATCH frames.
+
+    Commands are buffered until `flush()`, or until the `value` of one of their
+    results is read, so a whole sequence costs one socket round trip. Polls
+    added with `abort_on_failure` skip the rest of the frame if they time out.
+    Use as a context manager to flush on exit.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        # (type, addr, data, count, payload, result)
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def _add(self, cmd_type, addr=0, data=0, count=0, payload=b''):
+        result = _BatchResult(self, cmd_type)
+        self.commands.append((cmd_type, addr, data, count, payload, result))
+        return result
+
+    def write_reg(self, reg_addr, data):
+        return self._add(SPIDriver.CommandType.WRITE_REG, addr=reg_addr, data=data)
+
+    def write_reg_16b(self, reg_addr, data):
+        return self._add(SPIDriver.CommandType.WRITE_REG_16B, addr=reg_addr, data=data)
+
+    def poll_reg_for_value(self, reg_addr, expected_value, max_polls=20,
+                           abort_on_failure=False):
+        """Adds a poll, whose value is True if `expected_value` was read."""
+        cmd_type = SPIDriver.CommandType.POLL_REG_OR_ABORT if abort_on_failure \
+            else SPIDriver.CommandType.POLL_REG
+        return self._add(cmd_type, addr=reg_addr, data=expected_value, count=max_polls)
+
+    def idle_clocking(self, cycles):
+        return self._add(SPIDriver.CommandType.IDLE_CLOCKING, count=cycles)
+
+    def packed_write_transaction(self, target_addr, num_beats, data):
+        payload = data.to_bytes(num_beats * 16, 'little')
+        return self._add(SPIDriver.CommandType.PACKED_WRITE, addr=target_addr,
+                         count=num_beats, payload=payload)
+
+    def packed_write(self, target_addr, payload: bytes):
+        """Adds a packed write of `payload` (a multiple of 16 bytes)."""
+        return self._add(SPIDriver.CommandType.PACKED_WRITE, addr=target_addr,
+                         count=len(payload) // 16, payload=payload)
+
+    def read_spi_domain_reg(self, reg_addr):
+        return self._add(SPIDriver.CommandType.READ_SPI_DOMAIN_REG, addr=reg_addr)
+
+    def read_spi_domain_reg_16b(self, reg_addr):
+        return self._add(SPIDriver.CommandType.READ_SPI_DOMAIN_REG_16B, addr=reg_addr)
+
+    def bulk_read(self, num_bytes):
+        """Adds a bulk read, whose value is the bytes read."""
+        return self._add(SPIDriver.CommandType.BULK_READ, count=num_bytes)
+
+    def flush(self):
+        """Sends all buffered commands and fills in their results."""
+        commands, self.commands = self.commands, []
+        if not commands:
+            return
+        responses, bulk_data = self.driver._send_batch(
+            [command[:5] for command in commands])
+        offset = 0
+        for command, (data, success) in zip(commands, responses):
+            cmd_type, count, result = command[0], command[3], command[5]
+            result.done = True
+            if not success:
+                result.skipped = True
+                continue
+            if cmd_type == SPIDriver.CommandType.BULK_READ:
+                result._value = bulk_data[offset:offset + count]
+                offset += count
+            elif cmd_type in (SPIDriver.CommandType.POLL_REG,
+                              SPIDriver.CommandType.POLL_REG_OR_ABORT):
+                result._value = data == 1
+            else:
+                result._value = data
+
+
 class SPIDriver:
     """A driver that mimics the cocotb SPIMaster API and communicates with a
-    DPI-based server in the simulation over a TCP socket."""
+    DPI-based server in the simulation over a TCP socket.
+
+    If the SPI_DPI_SOCKET environment variable (or `socket_path`) names a Unix
+    domain socket, the driver connects to it instead, avoiding the TCP stack
+    for same-host runs.
+    """
 
     class CommandType:
         WRITE_REG = 0
@@ -29,19 +141,31 @@ class SPIDriver:
         READ_SPI_DOMAIN_REG = 5
         WRITE_REG_16B = 6
         READ_SPI_DOMAIN_REG_16B = 7
+        BATCH = 8
+        POLL_REG_OR_ABORT = 9
 
     # Format: < (little-endian), B (u8), I (u32), Q (u64), I (u32)
     COMMAND_FORMAT = "<BIQI"
     # Format: < (little-endian), Q (u64), B (u8)
     RESPONSE_FORMAT = "<QB"
+    RESPONSE_SIZE = struct.calcsize(RESPONSE_FORMAT)
+    # Initial size of the reusable receive buffer, grown on demand.
+    RECV_BUFFER_SIZE = 64 * 1024
 
-    def __init__(self, port: int = 5555):
+    def __init__(self, port: int = 5555, socket_path: str = None):
+        self.socket_path = os.environ.get("SPI_DPI_SOCKET", socket_path)
         port_str = os.environ.get("SPI_DPI_PORT")
         self.port = int(port_str) if port_str else port
-        print(f"SPI_DRIVER: Connecting to localhost:{self.port}...")
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect(("localhost", self.port))
+        if self.socket_path:
+            print(f"SPI_DRIVER: Connecting to unix socket {self.socket_path}...")
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(self.socket_path)
+        else:
+            print(f"SPI_DRIVER: Connecting to localhost:{self.port}...")
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.connect(("localhost", self.port))
         print("SPI_DRIVER: Connected.")
+        self._rx_buffer = bytearray(self.RECV_BUFFER_SIZE)
 
     def close(self):
         if self.sock:
@@ -49,22 +173,83 @@ class SPIDriver:
             self.sock.close()
             self.sock = None
 
-    def _send_command(self, cmd_type, addr=0, data=0, count=0, payload=b''):
+    def _post_command(self, cmd_type, addr=0, data=0, count=0, payload=b''):
+        """Sends a command without waiting for its response.
+
+        The DPI server executes commands in order, so several commands can be
+        posted before collecting their responses with `_recv_response`.
+        """
         cmd_header = struct.pack(self.COMMAND_FORMAT, cmd_type, addr, data, count)
-        self.sock.sendall(cmd_header)
+        self._send_buffers([cmd_header, payload])
 
-        if payload:
-            self.sock.sendall(payload)
+    def _send_buffers(self, buffers):
+        """Sends `buffers` in order with scatter/gather I/O, without joining them."""
+        buffers = [memoryview(b).cast('B') for b in buffers if len(b)]
+        while buffers:
+            # Stay well below IOV_MAX buffers per call.
+            sent = self.sock.sendmsg(buffers[:512])
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if buffers:
+                buffers[0] = buffers[0][sent:]
 
-        response_data = self.sock.recv(struct.calcsize(self.RESPONSE_FORMAT))
-        if not response_data:
-            raise ConnectionAbortedError("Socket connection broken.")
+    def _recv_into(self, view):
+        """Fills the writable memoryview `view`, however the stream is split."""
+        while view:
+            received = self.sock.recv_into(view)
+            if not received:
+                raise ConnectionAbortedError("Socket connection broken.")
+            view = view[received:]
 
-        unpacked = struct.unpack(self.RESPONSE_FORMAT, response_data)
+    def _recv_frame(self, size):
+        """Receives exactly `size` bytes into the reusable receive buffer.
+
+        Returns a memoryview of the buffer, which is only valid until the next
+        receive.
+        """
+        if size > len(self._rx_buffer):
+            self._rx_buffer = bytearray(max(size, 2 * len(self._rx_buffer)))
+        view = memoryview(self._rx_buffer)[:size]
+        self._recv_into(view)
+        return view
+
+    def _recv_response(self, cmd_type):
+        """Receives the response to the oldest posted command."""
+        unpacked = struct.unpack_from(self.RESPONSE_FORMAT,
+                                      self._recv_frame(self.RESPONSE_SIZE))
         if not unpacked[1]: # success flag
              raise RuntimeError(f"SPI command {cmd_type} failed in simulation.")
         return unpacked[0] # data
 
+    def _send_command(self, cmd_type, addr=0, data=0, count=0, payload=b''):
+        self._post_command(cmd_type, addr, data, count, payload)
+        return self._recv_response(cmd_type)
+
+    def _send_batch(self, commands):
+        """Sends (type, addr, data, count, payload) commands as one BATCH frame.
+
+        Returns a list of (data, success) per command, where commands skipped
+        after a failed POLL_REG_OR_ABORT have success False, and the bytes of
+        all successful bulk reads.
+        """
+        frame = [struct.pack(self.COMMAND_FORMAT, self.CommandType.BATCH, 0, 0, len(commands))]
+        for cmd_type, addr, data, count, payload in commands:
+            frame.append(struct.pack(self.COMMAND_FORMAT, cmd_type, addr, data, count))
+            frame.append(payload)
+        self._send_buffers(frame)
+
+        response_data = self._recv_frame(self.RESPONSE_SIZE * len(commands))
+        responses = [(data, bool(success)) for data, success in
+                     struct.iter_unpack(self.RESPONSE_FORMAT, response_data)]
+        bulk_bytes = sum(command[3] for command, (_, success) in zip(commands, responses)
+                         if command[0] == self.CommandType.BULK_READ and success)
+        return responses, bytes(self._recv_frame(bulk_bytes))
+
+    def batch(self):
+        """Returns an SPIBatch which sends commands through this driver."""
+        return SPIBatch(self)
+
     def write_reg(self, reg_addr, data):
         self._send_command(self.CommandType.WRITE_REG, addr=reg_addr, data=data)
 
@@ -94,8 +279,19 @@ class SPIDriver:
         return self._send_command(self.CommandType.READ_SPI_DOMAIN_REG_16B, addr=reg_addr)
 
     def bulk_read(self, num_bytes):
-        """Sends the new bulk read command and receives the data payload."""
-        self._send_command(self.CommandType.BULK_READ, count=num_bytes)
+        """Sends the new bulk read command and returns the payload as a bytearray."""
+        data = bytearray(num_bytes)
+        self.bulk_read_into(data)
+        return data
+
+    def bulk_read_into(self, buffer):
+        """Bulk reads len(buffer) bytes straight into the writable `buffer`.
+
+        Returns a memoryview of `buffer`. No memory is allocated per byte or
+        per read, so a buffer can be reused across reads.
+        """
+        view = memoryview(buffer).cast('B')
+        self._send_command(self.CommandType.BULK_READ, count=len(view))
         # After the command is acknowledged, the server sends the raw data payload.
-        read_payload = self.sock.recv(num_bytes)
-        return list(read_payload)
+        self._recv_into(view)
+        return view